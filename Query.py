@@ -1,12 +1,75 @@
+import json
 import requests
+import threading
+import tracing
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson   # optional, several times faster than the stdlib encoder for large payloads
+except ImportError:
+    orjson = None
+
+# One pooled keep-alive session per base URL, shared by all Query objects and threads
+_sessions = {}
+_session_settings = {}
+_sessions_lock = threading.Lock()
+
+def get_session(base_url, pool_size=None, retries=None, backoff_factor=None):
+    """Pooled session for base_url; rebuilt when given pool or retry settings differ.
+
+    Without settings an existing session is reused, else one with the defaults is made.
+    """
+    base_url = base_url.rstrip('/')
+    given = pool_size is not None or retries is not None or backoff_factor is not None
+    settings = (10 if pool_size is None else pool_size, 3 if retries is None else retries,
+                0.5 if backoff_factor is None else backoff_factor)
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is not None and given and _session_settings[base_url] != settings:
+            session.close()
+            session = None
+        if session is None:
+            pool_size, retries, backoff_factor = settings
+            retry = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "PUT", "DELETE", "HEAD", "OPTIONS"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+            _session_settings[base_url] = settings
+        return session
+
+def dumps_json(obj):
+    "Serialise a request body as UTF-8 JSON bytes, with orjson when installed"
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _session_settings.clear()
 
 class Query:
-    def __init__(self, base_url, headers=None, timeout=10, logger=None):
+    def __init__(self, base_url, headers=None, timeout=10, logger=None, session=None):
         self.base_url = base_url.rstrip('/')
         self.headers = headers or {}
         self.params = {}
         self.timeout = timeout
         self.logger = logger 
+        self.session = session or get_session(self.base_url)
 
     def post(self, endpoint, data=None, json=None):
         return self._request("POST", endpoint, data=data, json=json)
@@ -46,30 +109,54 @@ class Query:
     def post_fetch(self, endpoint, data=None, json=None):
         return self.post(endpoint, data=data, json=json)
 
+    def get_page(self, endpoint, params=None):
+        "GET one page; returns (records, total count from the X-Total-Count header or None)"
+        combined_params = self.params.copy()
+        if params:
+            combined_params.update(params)
+        response = self._send("GET", endpoint, params=combined_params)
+        self.params.clear()
+        if response is None:
+            return None, None
+        total = response.headers.get("X-Total-Count")
+        return (response.json() if response.content else []), (int(total) if total is not None else None)
+
     def _request(self, method, endpoint, **kwargs):
+        response = self._send(method, endpoint, **kwargs)
+        if response is not None and response.content:
+            return response.json()
+        return None
+
+    def _send(self, method, endpoint, **kwargs):
         url = f"{self.base_url}{endpoint}"
         self.logger.debug(f"Request url: {url} kwargs: {kwargs}")
-        try:
-            response = requests.request(
-                method,
-                url,
-                headers=self.headers,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
-            
-            self.logger.debug(
-                "HTTP %s %s -> %s %s",
-                method, response.url, response.status_code, response.text[:500]
-            )   
-
-            if response.content:
-                return response.json()
+        headers = self.headers
+        if kwargs.get("json") is not None:
+            kwargs["data"] = dumps_json(kwargs.pop("json"))
+            headers = {**headers, "Content-Type": "application/json"}
+        else:
+            kwargs.pop("json", None)
+        with tracing.span("http.request", method=method, endpoint=endpoint) as span:
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    **kwargs
+                )
+                span.set(status=response.status_code, bytes=len(response.content))
+                response.raise_for_status()
+                
+                self.logger.debug(
+                    "HTTP %s %s -> %s %s",
+                    method, response.url, response.status_code, response.text[:500]
+                )   
+                return response
+            except requests.HTTPError as e:
+                self.logger.error(f"{method} {url} – {response.status_code}")
+                self.logger.error(f"HTTP error: {e.response.status_code} {e.response.text}")
+            except requests.RequestException as e:
+                span.set(status="error")
+                self.logger.error(f"Request failed: {e}")
             return None
-        except requests.HTTPError as e:
-            self.logger.error(f"{method} {url} – {response.status_code}")
-            self.logger.error(f"HTTP error: {e.response.status_code} {e.response.text}")
-        except requests.RequestException as e:
-            self.logger.error(f"Request failed: {e}")
-        return None
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Union
 import math
 import random
+import numpy as np
 
 class TaskFailException(Exception):
     """Exception for use in forecast validation."""
@@ -43,50 +44,101 @@ def parse_time(time_val: Union[str, datetime]) -> datetime:
     else:
         raise TypeError("time must be string or datetime")
 
-def generate_result_series(
-    prs: List[Dict[str, Union[str, datetime, float]]],
-    start: datetime,
-    end: datetime,
-    interval: int,
-    initial: float
-) -> List[Dict[str, Union[datetime, float]]]:
+#######################################################################
+#### VECTORIZED RESAMPLING
+#######################################################################
+# Timestamps are parsed once into int64 epoch nanoseconds (naive values are
+# taken as UTC); lookups on a regular grid are done with searchsorted. The
+# input dicts are never modified.
+NS = 1_000_000_000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+def _epoch_ns(time_val: Union[str, datetime]) -> int:
+    dt = parse_time(time_val)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _US * 1000
+
+def to_epoch_ns(times) -> np.ndarray:
+    times = list(times)
+    # API timestamps are UTC "...Z" strings, which numpy parses directly
+    if times and all(isinstance(t, str) and t.endswith("Z") for t in times):
+        return np.array([t[:-1] for t in times], dtype='datetime64[ns]').view('int64')
+    return np.fromiter((_epoch_ns(t) for t in times), dtype='int64', count=len(times))
+
+def series_arrays(prs: List[Dict[str, Union[str, datetime, float]]]):
+    "Sorted (epoch ns, float values) arrays of a reading list"
+    times = to_epoch_ns(r["time"] for r in prs)
+    values = np.array([r["value"] for r in prs], dtype='float64')
+    order = np.argsort(times, kind='stable')
+    return times[order], values[order]
+
+def time_grid(start: datetime, end: datetime, interval: int) -> np.ndarray:
+    "Regular grid from start to end inclusive with interval seconds, as epoch ns"
     if start >= end:
         raise ValueError("start must be before end")
     if interval <= 0:
         raise ValueError("interval must be positive")
+    count = int((end - start).total_seconds() // interval) + 1  # include start
+    return _epoch_ns(start) + np.arange(count, dtype='int64') * int(interval * NS)
 
-    total_seconds = (end - start).total_seconds()
-    count = int(total_seconds // interval) + 1  # include start
-
-    for r in prs:
-        r["time"] = parse_time(r["time"])
-
-    prs = [r for r in prs if r["time"] <= end]  # lubame ka enne starti
-    prs.sort(key=lambda r: r["time"])
-
-    result = []
-    current_idx = 0
-    last_value = initial
-
-    for i in range(count):
-        current_time = start + timedelta(seconds=i * interval)
+def forward_fill(times: np.ndarray, values: np.ndarray, grid: np.ndarray, initial: float = None,
+                 label: str = "value", max_gap: int = None) -> np.ndarray:
+    """
+    Last value at or before every grid point.
 
-        while current_idx + 1 < len(prs) and prs[current_idx + 1]["time"] <= current_time:
-            current_idx += 1
+    Grid points before the first reading get `initial`, or raise TaskFailException
+    when initial is None. With max_gap (seconds), a reading older than max_gap
+    at a grid point also raises TaskFailException.
+    """
+    idx = np.searchsorted(times, grid, side='right') - 1
+    missing = idx < 0
+    if missing.any() and initial is None:
+        raise TaskFailException(f"No valid {label} value for time {_from_epoch_ns(grid[missing][0])}")
+    if max_gap is not None and len(times):
+        stale = ~missing & (grid - times[np.maximum(idx, 0)] > int(max_gap * NS))
+        if stale.any():
+            raise TaskFailException(f"No valid {label} value for time {_from_epoch_ns(grid[stale][0])}")
+    filled = values[np.maximum(idx, 0)] if len(values) else np.full(len(grid), np.nan)
+    if missing.any():
+        filled = np.where(missing, initial, filled)
+    return filled
+
+def common_time_range_ns(series_times: List[np.ndarray]):
+    "Latest start and earliest end over non-empty sorted epoch arrays"
+    series_times = [t for t in series_times if len(t)]
+    if not series_times:
+        raise ValueError("Kõik sisendseeriad on tühjad või puuduvad.")
+    starts = np.fromiter((t[0] for t in series_times), dtype='int64', count=len(series_times))
+    ends = np.fromiter((t[-1] for t in series_times), dtype='int64', count=len(series_times))
+    return int(starts.max()), int(ends.min())
 
-        if prs and prs[current_idx]["time"] <= current_time:
-            last_value = prs[current_idx]["value"]
+def _from_epoch_ns(ns) -> datetime:
+    return datetime.fromtimestamp(0, timezone.utc) + timedelta(microseconds=int(ns) // 1000)
 
-        result.append({"time": current_time, "value": last_value})
+def _grid_series(start: datetime, interval: int, values: np.ndarray) -> List[Dict[str, Union[datetime, float]]]:
+    return [{"time": start + timedelta(seconds=i * interval), "value": v} for i, v in enumerate(values.tolist())]
 
-    return result
+def generate_result_series(
+    prs: List[Dict[str, Union[str, datetime, float]]],
+    start: datetime,
+    end: datetime,
+    interval: int,
+    initial: float
+) -> List[Dict[str, Union[datetime, float]]]:
+    grid = time_grid(start, end, interval)
+    times, values = series_arrays(prs)
+    return _grid_series(start, interval, forward_fill(times, values, grid, initial=initial))
 
 def extract_prognosis_values(
     prs: List[Dict[str, Union[str, datetime, float]]],
     label: str,
     start: Union[str, datetime],
     end: Union[str, datetime],
-    interval: int
+    interval: int,
+    max_gap: int = None
 ) -> List[Dict[str, Union[datetime, float]]]:
     if not prs:
         raise TaskFailException(f"No proper {label}.")
@@ -96,38 +148,9 @@ def extract_prognosis_values(
     if isinstance(end, str):
         end = datetime.fromisoformat(end.replace("Z", "+00:00"))
 
-    if start >= end:
-        raise ValueError("start must be before end")
-    if interval <= 0:
-        raise ValueError("interval must be positive")
-
-    total_seconds = (end - start).total_seconds()
-    count = int(total_seconds // interval) + 1
-
-    for r in prs:
-        r["time"] = parse_time(r["time"])
-
-    prs = [r for r in prs if r["time"] <= end]  # võib olla ka enne starti
-    prs.sort(key=lambda r: r["time"])
-    times = [r["time"] for r in prs]
-
-    result = []
-    current_idx = 0
-
-    for i in range(count):
-        expected_time = start + timedelta(seconds=i * interval)
-        # Leia viimane väärtus, mille aeg ≤ expected_time
-        while current_idx + 1 < len(prs) and prs[current_idx + 1]["time"] <= expected_time:
-            current_idx += 1
-
-        if prs[current_idx]["time"] <= expected_time:
-            value = prs[current_idx]["value"]
-        else:
-            raise TaskFailException(f"No valid {label} value for time {expected_time}")
-
-        result.append({"time": expected_time, "value": value})
-
-    return result
+    grid = time_grid(start, end, interval)
+    times, values = series_arrays(prs)
+    return _grid_series(start, interval, forward_fill(times, values, grid, label=label, max_gap=max_gap))
 
 def find_common_time_range(series_list: List[List[Dict[str, str]]]) -> Dict[str, str]:
     """
@@ -137,27 +160,12 @@ def find_common_time_range(series_list: List[List[Dict[str, str]]]) -> Dict[str,
         series_list: List massiive, kus iga massiiv on kujul [{"time": "...", "value": ...}, ...]
 
     Returns:
-        Dict, kus on 'start' ja 'end' ISO 8601 kuupäevadena.
+        Dict, kus on 'start' ja 'end' ISO 8601 kuupäevadena (UTC).
     """
-    min_starts = []
-    max_ends = []
-
-    for series in series_list:
-        if not series:
-            continue  # ignoreeri tühje seeriaid
-        times = [datetime.fromisoformat(point["time"]) for point in series]
-        min_starts.append(min(times))
-        max_ends.append(max(times))
-
-    if not min_starts or not max_ends:
-        raise ValueError("Kõik sisendseeriad on tühjad või puuduvad.")
-
-    max_of_mins = max(min_starts)
-    min_of_maxs = min(max_ends)
-
+    start, end = common_time_range_ns([np.sort(to_epoch_ns(point["time"] for point in series)) for series in series_list])
     return {
-        "start": max_of_mins.isoformat(),
-        "end": min_of_maxs.isoformat()
+        "start": _from_epoch_ns(start).isoformat(),
+        "end": _from_epoch_ns(end).isoformat()
     }
     
 def extract_values_only(series: List[Dict[str, Union[datetime, float]]]) -> List[float]:
@@ -0,0 +1,351 @@
+### Historical backtest of generate_schedule ###
+# Replays the scheduler at every cycle over archived prognoses and realised
+# readings. The battery follows each plan for one cycle, and the realised cost
+# is accounted against the no-battery baseline.
+#
+# Archive directory, one file per series (.parquet or .csv):
+#   consumption, production, spot      realised readings: time, value
+#   <series>_prognoses                 optional archived prognoses: issued, time, value
+# Without archived prognoses the realised readings serve as perfect forecasts.
+# Days are independent so they replay in parallel; every day starts from the
+# same battery charge.
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import signal
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytz
+import yaml
+import ess_scheduling
+import Util
+from schedule_cache import epoch_ns
+
+SERIES = ("consumption", "production", "spot")
+DAY = 86400
+
+# Battery, PCC and scheduler settings of the replayed site; a config file's
+# params and its optional `backtest` section override them
+SITE_DEFAULTS = dict(
+    interval=900, horizon_h=24, timezone="Europe/Tallinn",
+    ess_max_p=5000, ess_max_e=10000, start_charge=5000, ess_charge_end=5000,
+    ess_soc_min=10, ess_soc_max=90, ess_safe_min=10,
+    pccImportLimitW=20000, pccExportLimitW=-15000,
+    DAY_TARIFF=0.07, NIGHT_TARIFF=0.05, ESS_DEG_COST=0.139,
+    model_backend="dp", solver="glpk", mip_gap=None, warm_start=True, fallback="dp",
+)
+
+def load_site(config_path=None, **overrides):
+    site = dict(SITE_DEFAULTS)
+    if config_path:
+        with open(config_path, "r") as f:
+            raw_data = yaml.safe_load(f)
+        site.update({k: v for k, v in raw_data['params'].items() if k in SITE_DEFAULTS})
+        site.update(raw_data.get('backtest') or {})
+    site.update({k: v for k, v in overrides.items() if v is not None})
+    return site
+
+#######################################################################
+#### ARCHIVE
+#######################################################################
+def _series_path(directory, name):
+    for ext in (".parquet", ".csv"):
+        path = os.path.join(directory, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def _read_table(path):
+    table = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+    return table.dropna(subset=["value"])
+
+def _epoch_column(column):
+    return epoch_ns(pd.DatetimeIndex(pd.to_datetime(column, utc=True)))
+
+class Archive:
+    "Realised readings and archived prognoses as sorted epoch-ns arrays"
+
+    def __init__(self, directory):
+        self.readings = {}
+        self.prognoses = {}
+        for name in SERIES:
+            path = _series_path(directory, name)
+            if path is None:
+                raise FileNotFoundError(f"No {name} readings in {directory}")
+            table = _read_table(path)
+            times = _epoch_column(table["time"])
+            order = np.argsort(times, kind="stable")
+            self.readings[name] = (times[order], table["value"].to_numpy(dtype="float64")[order])
+
+            path = _series_path(directory, f"{name}_prognoses")
+            if path is not None:
+                table = _read_table(path)
+                issued, times = _epoch_column(table["issued"]), _epoch_column(table["time"])
+                order = np.lexsort((times, issued))
+                issued, times = issued[order], times[order]
+                starts = np.flatnonzero(np.r_[True, issued[1:] != issued[:-1]])
+                # Issue times and row offsets of every prognosis
+                self.prognoses[name] = (issued[starts], np.r_[starts, len(issued)], times,
+                                        table["value"].to_numpy(dtype="float64")[order])
+
+    def span(self):
+        "First and last epoch ns covered by all realised series"
+        return Util.common_time_range_ns([times for times, _ in self.readings.values()])
+
+    def realised(self, name, grid, interval):
+        "Reading in force at every grid point; NaN outside the archived range"
+        times, values = self.readings[name]
+        filled = Util.forward_fill(times, values, grid, initial=np.nan)
+        filled[grid >= times[-1] + interval * Util.NS] = np.nan
+        return filled
+
+    def forecast(self, name, now, start, end, interval):
+        "Latest prognosis issued at or before now on the interval grid over [start, end), as (times, values)"
+        if name in self.prognoses:
+            issued, offsets, times, values = self.prognoses[name]
+            k = np.searchsorted(issued, now, side="right") - 1
+            if k < 0:
+                return np.empty(0, dtype="int64"), np.empty(0)
+            times, values = times[offsets[k]:offsets[k + 1]], values[offsets[k]:offsets[k + 1]]
+        else:
+            times, values = self.readings[name]
+        if len(times) == 0:
+            return times, values
+        # Prognoses may be coarser than the cycle interval; each value holds until the next one
+        step = times[-1] - times[-2] if len(times) > 1 else interval * Util.NS
+        end = min(end, times[-1] + step)
+        grid = np.arange(start, end, interval * Util.NS, dtype="int64")
+        filled = Util.forward_fill(times, values, grid, initial=np.nan)
+        keep = ~np.isnan(filled)
+        return grid[keep], filled[keep]
+
+#######################################################################
+#### REPLAY
+#######################################################################
+def cycle_arguments(archive, site, now, charge, plan, logger):
+    "generate_schedule keyword arguments for a cycle starting at now (epoch ns)"
+    interval = site["interval"]
+    step = interval * Util.NS
+    end = now + int(site["horizon_h"] * 3600) * Util.NS
+
+    # Consumption and production start one interval before the prices so every price period has a value
+    prognoses = {}
+    for name, start in (("consumption", now - step), ("production", now - step), ("spot", now)):
+        times, values = archive.forecast(name, now, start, end, interval)
+        prognoses[name] = {"time": times.astype("datetime64[ns]"), "value": values}
+    spot = prognoses["spot"]
+    spot["id"] = spot["datapointPrognosisId"] = np.zeros(len(spot["value"]), dtype="int64")
+
+    return dict(
+        lastProductionPrognosis=prognoses["production"],
+        lastConsumptionPrognosis=prognoses["consumption"],
+        lastNpSpotPricePrognosis=spot,
+        npSpotCurrentPrice=float(archive.realised("spot", np.array([now]), interval)[0]),
+        lastEss_e_lt=plan,
+        ess_p=0,
+        ess_charge=charge,
+        ess_charge_end=site["ess_charge_end"],
+        ess_soc=charge / site["ess_max_e"],
+        ess_max_p=site["ess_max_p"],
+        ess_max_e=site["ess_max_e"],
+        ess_soc_min=site["ess_soc_min"],
+        ess_soc_max=site["ess_soc_max"],
+        ess_safe_min=site["ess_safe_min"],
+        pccImportLimitW=site["pccImportLimitW"],
+        pccExportLimitW=site["pccExportLimitW"],
+        startTime=datetime(1970, 1, 1) + timedelta(microseconds=int(now) // 1000),
+        interval=interval,
+        DAY_TARIFF=site["DAY_TARIFF"],
+        NIGHT_TARIFF=site["NIGHT_TARIFF"],
+        ESS_DEG_COST=site["ESS_DEG_COST"],
+        local_timezone=pytz.timezone(site["timezone"]),
+        logger=logger,
+        model_backend=site["model_backend"],
+        solver=site["solver"],
+        mip_gap=site["mip_gap"],
+        warm_start=site["warm_start"],
+        fallback=site["fallback"])
+
+def replay_day(archive, site, day_start, logger):
+    "Run every cycle of one UTC day; per-cycle plan power, start charge, solve status and time"
+    interval = site["interval"]
+    hours = interval / 3600
+    cycles = DAY // interval
+    times = day_start + np.arange(cycles, dtype="int64") * interval * Util.NS
+    ess = np.zeros(cycles)
+    charge = np.zeros(cycles)
+    solve_s = np.zeros(cycles)
+    status = np.empty(cycles, dtype=object)
+
+    level = float(site["start_charge"])
+    plan, plan_times, plan_values = [], np.empty(0, dtype="int64"), np.empty(0)
+    for i, now in enumerate(times):
+        started = time.perf_counter()
+        try:
+            schedule = ess_scheduling.generate_schedule(**cycle_arguments(archive, site, now, level, plan, logger))
+        except Exception as e:
+            logger.warning(f"Cycle {Util._from_epoch_ns(now)}: scheduling failed: {e}")
+            schedule = None
+        solve_s[i] = time.perf_counter() - started
+
+        if schedule is None or len(schedule) == 0:
+            status[i] = "failed"
+        else:
+            status[i] = schedule.attrs.get("solve_status", "optimal")
+            plan_times = epoch_ns(pd.DatetimeIndex(schedule["datetime"]))
+            plan_values = schedule["ESS"].to_numpy(dtype="float64")
+            plan = {"time": plan_times.astype("datetime64[ns]"), "value": plan_values}
+
+        # The battery keeps following the last posted plan, within its power and energy limits
+        k = np.searchsorted(plan_times, now, side="right") - 1
+        power = plan_values[k] if k >= 0 else 0.0
+        power = np.clip(power, -site["ess_max_p"], site["ess_max_p"])
+        power = np.clip(power, -level / hours, (site["ess_max_e"] - level) / hours)
+        ess[i], charge[i] = power, level
+        level += power * hours
+
+    return {"time": times, "ess": ess, "charge": charge, "status": status, "solve_s": solve_s}
+
+_archive = None
+_site = None
+_worker_logger = None
+
+def _init_worker(archive, site, log_level):
+    # Same console-only worker logging as batch
+    global _archive, _site, _worker_logger
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _archive, _site = archive, site
+    _worker_logger = logging.getLogger("backtest-worker")
+    _worker_logger.handlers = []
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    _worker_logger.addHandler(handler)
+    _worker_logger.setLevel(log_level)
+    _worker_logger.propagate = False
+
+def _replay_day(day_start):
+    return replay_day(_archive, _site, day_start, _worker_logger)
+
+#######################################################################
+#### ACCOUNTING
+#######################################################################
+def cycle_costs(ess, load, pv, spot, tariff, kW_to_kWh, deg_cost):
+    "Realised cost per cycle in EUR, with the import/export/tariff/degradation terms of the model objective"
+    energy = kW_to_kWh / 1000
+    pcc = load + pv + ess
+    price = np.where(pcc > 0, spot / 1000 + tariff, spot / 1000)
+    return pcc * price * energy + np.maximum(ess, 0) * energy * deg_cost
+
+def account(archive, site, columns):
+    "Add realised inputs, costs and the no-battery baseline to the per-cycle columns"
+    interval = site["interval"]
+    times = columns["time"]
+    for name, column in (("consumption", "load"), ("production", "pv"), ("spot", "spot")):
+        columns[column] = archive.realised(name, times, interval)
+        if np.isnan(columns[column]).any():
+            first = Util._from_epoch_ns(times[np.isnan(columns[column])][0])
+            raise ValueError(f"No realised {name} reading for {first}")
+    columns["tariff"] = ess_scheduling.grid_tariff(pd.DatetimeIndex(times.astype("datetime64[ns]"), tz="UTC"),
+                                                   site["DAY_TARIFF"], site["NIGHT_TARIFF"])
+    costs = dict(kW_to_kWh=interval / 3600, deg_cost=site["ESS_DEG_COST"])
+    columns["cost"] = cycle_costs(columns["ess"], columns["load"], columns["pv"], columns["spot"], columns["tariff"], **costs)
+    columns["baseline_cost"] = cycle_costs(0.0, columns["load"], columns["pv"], columns["spot"], columns["tariff"], **costs)
+    pcc = columns["load"] + columns["pv"] + columns["ess"]
+    columns["pcc_violation"] = (pcc > site["pccImportLimitW"]) | (pcc < site["pccExportLimitW"])
+    return columns
+
+def summarise(columns, elapsed):
+    cycles = len(columns["time"])
+    cost, baseline = float(columns["cost"].sum()), float(columns["baseline_cost"].sum())
+    return {
+        "days": len(np.unique(columns["time"] // (DAY * Util.NS))),
+        "cycles": cycles,
+        "cost": round(cost, 4),
+        "baseline_cost": round(baseline, 4),
+        "savings": round(baseline - cost, 4),
+        "savings_pct": round((baseline - cost) / abs(baseline) * 100, 3) if baseline else None,
+        "pcc_violations": int(columns["pcc_violation"].sum()),
+        "status": dict(Counter(columns["status"].tolist())),
+        "solve_s_mean": round(float(columns["solve_s"].mean()), 4),
+        "solve_s_p95": round(float(np.quantile(columns["solve_s"], 0.95)), 4),
+        "elapsed_s": round(elapsed, 1),
+    }
+
+def write_results(path, columns):
+    "Per-cycle columns as .parquet (needs a pandas parquet engine) or compressed .npz"
+    if path.endswith(".parquet"):
+        frame = pd.DataFrame(columns)
+        frame["time"] = pd.to_datetime(frame["time"], utc=True)
+        frame.to_parquet(path, index=False)
+    else:
+        np.savez_compressed(path, **{k: (v.astype(str) if v.dtype == object else v) for k, v in columns.items()})
+
+#######################################################################
+#### MAIN
+#######################################################################
+def run_backtest(archive, site, day_starts, logger, workers=None):
+    "Replay the given UTC days (epoch ns) and return the accounted per-cycle columns"
+    workers = workers or os.cpu_count() or 1
+    days = {}
+    # Workers log warnings only; every cycle logs its costs at info level
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(archive, site, max(logging.WARNING, logger.getEffectiveLevel()))) as pool:
+        futures = {pool.submit(_replay_day, day): day for day in day_starts}
+        for future in as_completed(futures):
+            day = futures[future]
+            days[day] = future.result()
+            logger.info(f"Replayed {Util._from_epoch_ns(day):%Y-%m-%d} ({len(days)}/{len(day_starts)} days)")
+    columns = {k: np.concatenate([days[day][k] for day in sorted(days)]) for k in days[day_starts[0]]}
+    return account(archive, site, columns)
+
+def backtest_days(archive, start=None, days=None):
+    "Whole UTC days to replay: from start (YYYY-MM-DD), or the first whole archived day, up to the archive end"
+    first, last = archive.span()
+    day_ns = DAY * Util.NS
+    begin = (_epoch_day(start) if start else -(-first // day_ns) * day_ns)
+    available = max(0, (last - begin) // day_ns)
+    count = min(days, available) if days else available
+    return [begin + k * day_ns for k in range(int(count))]
+
+def _epoch_day(day):
+    return int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) * Util.NS
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay generate_schedule over archived prognoses and readings")
+    parser.add_argument("archive", help="Directory with consumption, production and spot files")
+    parser.add_argument("-c", "--config", help="Site config YAML; params and the backtest section override the defaults")
+    parser.add_argument("--start", help="First UTC day, YYYY-MM-DD (default: first whole archived day)")
+    parser.add_argument("--days", type=int, help="Number of days (default: up to the end of the archive)")
+    parser.add_argument("--backend", help="Model backend, overrides the config")
+    parser.add_argument("--solver", help="Solver, overrides the config")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("-o", "--output", default="backtest_results.npz", help="Per-cycle results, .npz or .parquet")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("backtest")
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    if args.output.endswith(".parquet") and not any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet")):
+        parser.error("parquet output needs pyarrow or fastparquet; use an .npz output instead")
+
+    site = load_site(args.config, model_backend=args.backend, solver=args.solver)
+    archive = Archive(args.archive)
+    day_starts = backtest_days(archive, args.start, args.days)
+    if not day_starts:
+        parser.error("the archive holds no whole day to replay")
+
+    started = time.perf_counter()
+    columns = run_backtest(archive, site, day_starts, logger, args.workers)
+    summary = summarise(columns, time.perf_counter() - started)
+    write_results(args.output, columns)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
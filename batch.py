@@ -0,0 +1,151 @@
+### Multi-site batch scheduling ###
+# Fetches inputs for many site configs through the shared HTTP layer, solves
+# the sites on a process pool and posts the resulting plans.
+import argparse
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ess_scheduling
+import main
+import tracing
+
+_worker_logger = None
+
+def _init_worker(log_level):
+    # Workers log to the console only; the parent's Loki thread does not survive fork
+    global _worker_logger
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_logger = logging.getLogger(f"{main.APP_NAME}-worker")
+    _worker_logger.handlers = []
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    _worker_logger.addHandler(handler)
+    _worker_logger.setLevel(log_level)
+    _worker_logger.propagate = False
+
+class _SiteTimeout(BaseException):
+    # Not an Exception, so solver error handling (except Exception / OSError) cannot swallow it
+    pass
+
+def _on_timeout(signum, frame):
+    raise _SiteTimeout()
+
+def _solve_site(site, kwargs, timeout):
+    # The timeout starts when a worker picks the site up, so queued sites are not charged for waiting;
+    # subprocess.run kills a running glpsol when the alarm interrupts it
+    if timeout:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    started = time.perf_counter()
+    try:
+        try:
+            schedule = ess_scheduling.generate_schedule(**kwargs, logger=_worker_logger)
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except _SiteTimeout:
+        raise TimeoutError(f"site scheduling timed out after {timeout} s") from None
+    # The schedule cache was pickled into this process; hand its new state back to the parent
+    return site, schedule, time.perf_counter() - started, kwargs.get("schedule_cache")
+
+def _client_key(raw_data):
+    return tuple(repr(raw_data['params'].get(k)) for k in main.QUERY_UTILS_PARAMS)
+
+def _use_client(raw_data, logger, current_key):
+    # query_utils holds one API client; re-initialising it drops the datapoint and prognosis caches,
+    # so it only happens when a site uses another API or other client settings
+    key = _client_key(raw_data)
+    if key != current_key:
+        main.init_query_utils(raw_data, logger)
+    return key
+
+def run_batch(config_paths, logger, workers=None, timeout=None):
+    workers = workers or os.cpu_count() or 1
+    results = {path: {"status": "pending"} for path in config_paths}
+    configs = {}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(logger.getEffectiveLevel(),)) as pool:
+        for path in config_paths:
+            try:
+                configs[path] = main.load_config(path)
+            except Exception as e:
+                results[path] = {"status": "fetch_failed", "error": str(e)}
+                logger.error(f"{path}: loading the config failed: {e}")
+
+        # Fetch sequentially per site (each fetch is concurrent), grouped by API client, and hand sites
+        # to the pool as soon as they are ready
+        futures = {}
+        client = None
+        for path in sorted(configs, key=lambda p: _client_key(configs[p])):
+            raw_data = configs[path]
+            try:
+                client = _use_client(raw_data, logger, client)
+                inputs = main.fetch_schedule_inputs(raw_data)
+                kwargs = main.schedule_arguments(raw_data, inputs, logger)
+                del kwargs["logger"]
+                futures[pool.submit(_solve_site, path, kwargs, timeout)] = path
+            except Exception as e:
+                results[path] = {"status": "fetch_failed", "error": str(e)}
+                logger.error(f"{path}: fetching inputs failed: {e}")
+
+        solved = {}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, schedule, solve_s, worker_cache = future.result()
+            except Exception as e:
+                status = "timeout" if isinstance(e, TimeoutError) else "solve_failed"
+                results[path] = {"status": status, "error": str(e)}
+                logger.error(f"{path}: scheduling failed: {e}")
+                continue
+            if worker_cache is not None:
+                main.get_schedule_cache(configs[path]).update(worker_cache)
+            if schedule is None:
+                results[path] = {"status": "no_solution", "solve_s": round(solve_s, 3)}
+                logger.warning(f"{path}: optimization found no solution, prognosis not updated")
+                continue
+            if schedule.attrs.get("cache_hit"):
+                results[path] = {"status": "unchanged", "solve_s": round(solve_s, 3)}
+                continue
+            solved[path] = schedule
+            results[path] = {"status": "solved", "solve_s": round(solve_s, 3)}
+
+    # Post plans site by site through the shared session pool
+    for path in sorted(solved, key=lambda p: _client_key(configs[p])):
+        schedule = solved[path]
+        try:
+            client = _use_client(configs[path], logger, client)
+            main.post_schedule(configs[path], schedule, logger)
+            results[path]["status"] = "posted"
+        except Exception as e:
+            cache = main.get_schedule_cache(configs[path])
+            if cache is not None:
+                cache.clear()
+            results[path] = {**results[path], "status": "post_failed", "error": str(e)}
+            logger.error(f"{path}: posting the plan failed: {e}")
+
+    elapsed = time.perf_counter() - started
+    done = sum(r["status"] in ("posted", "unchanged") for r in results.values())
+    logger.info(f"Batch finished: {done}/{len(config_paths)} sites scheduled in {elapsed:.1f} s "
+                f"({done / elapsed * 60 if elapsed else 0:.1f} sites/min, {workers} workers)")
+    return results
+
+def main_batch():
+    parser = argparse.ArgumentParser(description=f"Run {main.APP_NAME} for many site config files")
+    parser.add_argument("configs", nargs="+", help="Paths to site config YAML files")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Solver processes (default: CPU count)")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Per-site scheduling timeout in seconds")
+    args = parser.parse_args()
+
+    logger = main.init_logger(main.load_config(args.configs[0]))
+    tracing.enable(False)
+    results = run_batch(args.configs, logger, args.workers, args.timeout)
+    for path, result in results.items():
+        logger.info(f"{path}: {result}")
+
+if __name__ == "__main__":
+    main_batch()
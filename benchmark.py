@@ -0,0 +1,185 @@
+### Offline benchmark for ess_scheduling.generate_schedule ###
+# Runs the scheduler on synthetic prognoses for several horizons and
+# resolutions and writes per-stage timings and peak memory as JSON.
+import argparse
+import json
+import logging
+import math
+import platform
+import random
+import resource
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+import pytz
+import ess_scheduling
+import Util
+
+HORIZONS_H = (24, 48, 168)
+INTERVALS_MIN = (60, 15, 5)
+STAGES = ("dataset", "model_build", "solve", "extract")
+
+def synthetic_prognoses(horizon_h, interval_min, seed=0, start_time=None):
+    "Production, consumption and spot price prognoses in the format query_utils returns"
+    rnd = random.Random(seed)
+    start_time = start_time or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    count = horizon_h * 60 // interval_min
+
+    # Consumption and production start one interval before the prices so every price period has a value
+    production = Util.generate_prognosis_entries(count + 1, start_time - timedelta(minutes=interval_min), interval_min)
+    consumption = Util.generate_prognosis_entries(count + 1, start_time - timedelta(minutes=interval_min), interval_min)
+    price = Util.generate_prognosis_entries(count, start_time, interval_min)
+
+    for i, (p, c) in enumerate(zip(production, consumption)):
+        hour = (i * interval_min / 60) % 24
+        p['value'] = -max(0.0, 8000 * math.sin((hour - 6) / 14 * math.pi)) * rnd.uniform(0.7, 1.0) if 6 <= hour <= 20 else 0.0
+        c['value'] = 2500 + 1500 * math.sin((hour - 7) / 24 * 2 * math.pi) + rnd.uniform(0, 800)
+    for i, r in enumerate(price):
+        hour = (i * interval_min / 60) % 24
+        r['value'] = 80 + 60 * math.sin((hour - 9) / 24 * 2 * math.pi) + rnd.uniform(-15, 15)
+
+    return production, consumption, price
+
+def synthetic_arguments(horizon_h, interval_min, seed=0):
+    "generate_schedule keyword arguments for a synthetic site"
+    production, consumption, price = synthetic_prognoses(horizon_h, interval_min, seed)
+    return dict(
+        lastProductionPrognosis=production,
+        lastConsumptionPrognosis=consumption,
+        lastNpSpotPricePrognosis=price,
+        npSpotCurrentPrice=price[0]['value'],
+        lastEss_e_lt=[],
+        ess_p=0,
+        ess_charge=5000,
+        ess_soc=0.5,
+        ess_max_p=5000,
+        ess_max_e=10000,
+        ess_charge_end=5000,
+        ess_soc_min=10,
+        ess_soc_max=90,
+        ess_safe_min=10,
+        interval=interval_min * 60,
+        local_timezone=pytz.timezone('Europe/Tallinn'))
+
+def site_arguments(config_path, logger):
+    "generate_schedule keyword arguments from a site's live inputs"
+    import main
+    raw_data = main.load_config(config_path)
+    main.init_query_utils(raw_data, logger)
+    arguments = main.schedule_arguments(raw_data, main.fetch_schedule_inputs(raw_data), logger)
+    for key in ("logger", "model_backend", "solver", "schedule_cache", "deadline"):
+        arguments.pop(key, None)
+    return arguments
+
+def measure(arguments, model_backend="pyomo", solver="glpk", logger=None):
+    timings = {}
+    status = "ok"
+    objective = None
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        schedule = ess_scheduling.generate_schedule(
+            **arguments,
+            logger=logger,
+            model_backend=model_backend,
+            solver=solver,
+            timings=timings)
+        if schedule is None:
+            status = "no_solution"
+        else:
+            objective = schedule.attrs.get("objective")
+    except Exception as e:
+        status = f"error: {e}"
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "model_backend": model_backend,
+        "solver": timings.get("solver", solver),
+        "status": status,
+        "timings_s": {stage: round(timings.get(stage, 0.0), 6) for stage in STAGES},
+        "total_s": round(total, 6),
+        "objective": objective,
+        "peak_python_mem_mb": round(peak / 2**20, 3),
+    }
+
+def run_case(horizon_h, interval_min, model_backend="pyomo", seed=0, logger=None, solver="glpk"):
+    arguments = synthetic_arguments(horizon_h, interval_min, seed)
+    return {
+        "horizon_h": horizon_h,
+        "interval_min": interval_min,
+        "periods": len(arguments["lastNpSpotPricePrognosis"]),
+        **measure(arguments, model_backend, solver, logger),
+    }
+
+def add_dp_gap(results, dp_result):
+    "Gap of the DP plan cost to each solver's objective, relative as for MIP gaps and in EUR"
+    for result in results:
+        if result["objective"] is None or dp_result["objective"] is None:
+            continue
+        difference = dp_result["objective"] - result["objective"]
+        result["dp_gap"] = round(abs(difference) / max(abs(result["objective"]), 1e-9), 6)
+        result["dp_gap_eur"] = round(difference, 6)
+
+def print_result(label, result):
+    print(f"{label} {result['solver']:>5}: "
+          + ", ".join(f"{k}={v:.3f}s" for k, v in result["timings_s"].items())
+          + f", peak={result['peak_python_mem_mb']:.1f} MB, {result['status']}"
+          + (f", DP gap {result['dp_gap']:.2%} ({result['dp_gap_eur']:+.3f} EUR)" if "dp_gap" in result else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_schedule and its solvers on synthetic prognoses or a site's live inputs")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="Path of the JSON result file")
+    parser.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS_H), help="Horizons in hours")
+    parser.add_argument("--intervals", type=int, nargs="+", default=list(INTERVALS_MIN), help="Intervals in minutes")
+    parser.add_argument("--backend", default="pyomo", help="Model backend passed to generate_schedule")
+    parser.add_argument("--solvers", nargs="+", default=["glpk"], help="Solvers to compare, or 'all' for every available one")
+    parser.add_argument("--config", help="Benchmark the live inputs of this site config instead of synthetic cases")
+    parser.add_argument("--dp-gap", action="store_true", help="Also run the DP dispatcher and report its gap to each solver")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.WARNING)
+
+    solvers = ess_scheduling.available_solvers(args.backend) if args.solvers == ["all"] else args.solvers
+    results = []
+    if args.config:
+        # Same instance through every solver, to pick the fastest one for the site
+        arguments = site_arguments(args.config, logger)
+        case = [{"site": args.config, **measure(arguments, args.backend, solver, logger)} for solver in solvers]
+        if args.dp_gap:
+            dp_result = {"site": args.config, **measure(arguments, "dp", "dp", logger)}
+            add_dp_gap(case, dp_result)
+            case.append(dp_result)
+        for result in case:
+            print_result(args.config, result)
+        results += case
+    else:
+        for horizon_h in args.horizons:
+            for interval_min in args.intervals:
+                case = [run_case(horizon_h, interval_min, args.backend, args.seed, logger, solver) for solver in solvers]
+                if args.dp_gap:
+                    dp_result = run_case(horizon_h, interval_min, "dp", args.seed, logger, "dp")
+                    add_dp_gap(case, dp_result)
+                    case.append(dp_result)
+                for result in case:
+                    print_result(f"{horizon_h:>4} h @ {interval_min:>2} min ({result['periods']:>5} periods)", result)
+                results += case
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "glpsol": ess_scheduling.GLPSOL_EXECUTABLE,
+        # glpsol runs as a child process; ru_maxrss is reported in KiB on Linux
+        "peak_solver_mem_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 3),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+### Dynamic-programming ESS dispatch ###
+# Same problem as ess_scheduling.build_pyomo_model for a single battery.
+# The PCC power follows from the ESS power and prices are linear, so the cost
+# of a period depends only on the SoC change. Backward induction over a
+# discretised SoC grid then finds the cheapest plan without an external
+# solver, in O(T x S x A) NumPy operations. SoC levels are soc_0 plus
+# multiples of the grid step; the last period steers exactly onto soc_end.
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SOC_STEP = 0.2          # %, SoC grid resolution
+MIN_ACTIONS = 10        # SoC steps per direction at full power; the grid is refined for short intervals
+
+def soc_grid(soc_0, step):
+    "SoC levels within [0, 100] spaced step apart through soc_0, and the index of soc_0"
+    below = int(np.floor(soc_0 / step + 1e-9))
+    above = int(np.floor((100 - soc_0) / step + 1e-9))
+    return soc_0 + step * np.arange(-below, above + 1), below
+
+def period_costs(load, pv, spot, tariff, ess, imp_lim_kW, exp_lim_kW, kW_to_kWh, deg_cost, tol=1e-6):
+    "Cost of each ESS power (columns) in each period (rows); inf where a PCC limit is exceeded"
+    energy = kW_to_kWh / 1000
+    pcc = (load + pv)[:, None] + ess
+    price = np.where(pcc > 0, spot[:, None] / 1000 + tariff[:, None], spot[:, None] / 1000)
+    cost = pcc * price * energy + np.maximum(ess, 0) * energy * deg_cost
+    cost[(pcc > imp_lim_kW + tol) | (pcc < exp_lim_kW - tol)] = np.inf
+    return cost
+
+def solve_dp(load, pv, spot, tariff, ess_kW, imp_lim_kW, exp_lim_kW, kW_to_kWh, ess_eff_kWh, soc_0, soc_end, deg_cost,
+             soc_end_value=0.0, soc_step=SOC_STEP):
+    "ESS power per period (W) of the cheapest plan on the SoC grid, or None when no plan keeps the limits"
+    load, pv, spot, tariff = (np.asarray(a, dtype='float64') for a in (load, pv, spot, tariff))
+    T = len(load)
+    gain = kW_to_kWh / ess_eff_kWh * 100
+    soc_0 = min(max(soc_0, 0.0), 100.0)
+    step = min(soc_step, ess_kW * gain / MIN_ACTIONS) if ess_kW > 0 else soc_step
+    levels, start = soc_grid(soc_0, step)
+    D = int(np.floor(ess_kW * gain / step + 1e-9))
+    actions = np.arange(-D, D + 1) * step / gain
+    limits = dict(imp_lim_kW=imp_lim_kW, exp_lim_kW=exp_lim_kW, kW_to_kWh=kW_to_kWh, deg_cost=deg_cost)
+
+    # Value of each SoC level after the grid periods; a fixed end target is met exactly by the last period
+    fixed_end = soc_end is not None
+    steps = T - 1 if fixed_end else T
+    if fixed_end:
+        last = (soc_end - levels) / gain
+        value = period_costs(load[-1:], pv[-1:], spot[-1:], tariff[-1:], last[None, :], **limits)[0]
+        value[np.abs(last) > ess_kW + 1e-9] = np.inf
+    else:
+        value = -soc_end_value * levels
+    cost = period_costs(load[:steps], pv[:steps], spot[:steps], tariff[:steps], actions, **limits)
+
+    # Backward induction; row i of the window view holds the values of levels i - D ... i + D
+    N = len(levels)
+    choice = np.empty((steps, N), dtype=np.int32)
+    padded = np.full(N + 2 * D, np.inf)
+    windows = sliding_window_view(padded, 2 * D + 1)   # a view, follows the updates of padded
+    rows = np.arange(N)
+    for t in range(steps - 1, -1, -1):
+        padded[D:D + N] = value
+        q = windows + cost[t]
+        choice[t] = q.argmin(axis=1)
+        value = q[rows, choice[t]]
+    if not np.isfinite(value[start]):
+        return None
+
+    plan = np.empty(T)
+    level = start
+    for t in range(steps):
+        plan[t] = actions[choice[t, level]]
+        level += choice[t, level] - D
+    if fixed_end:
+        plan[-1] = last[level]
+    return plan
@@ -0,0 +1,334 @@
+### Matrix-form ESS/PCC MILP ###
+# Same formulation as ess_scheduling.build_pyomo_model, assembled directly as
+# sparse matrices: min c'x  s.t.  row_lb <= A x <= row_ub,  lb <= x <= ub.
+import os
+import re
+import subprocess
+import tempfile
+from typing import NamedTuple
+import numpy as np
+from scipy import sparse
+
+try:
+    import highspy  # optional, HiGHS bindings with MIP start support
+except ImportError:
+    highspy = None
+
+# Variable blocks, each of length T. Binary blocks come first so a single
+# MARKER section covers all integer columns in the MPS file.
+VARIABLES = (
+    "PCC_exp_z",
+    "PCC_imp_z",
+    "ESS_kW_charge_z",
+    "ESS_kW_discharge_z",
+    "PCC_EXPORT_kW",
+    "PCC_IMPORT_kW",
+    "ESS_kW",
+    "ESS_kW_charge",
+    "ESS_kW_discharge",
+    "ESS_SoC",
+)
+BINARIES = VARIABLES[:4]
+
+class MatrixModel(NamedTuple):
+    c: np.ndarray
+    A: sparse.csr_matrix
+    row_lb: np.ndarray
+    row_ub: np.ndarray
+    lb: np.ndarray
+    ub: np.ndarray
+    integrality: np.ndarray      # 1 for integer columns, 0 for continuous
+    n_periods: int
+
+    def column(self, name):
+        k = VARIABLES.index(name)
+        return slice(k * self.n_periods, (k + 1) * self.n_periods)
+
+def build_matrices(load, pv, spot, tariff, ess_kW, imp_lim_kW, exp_lim_kW, kW_to_kWh, ess_eff_kWh, soc_0, soc_end, deg_cost, soc_end_value=0.0):
+    load = np.asarray(load, dtype='float64')
+    pv = np.asarray(pv, dtype='float64')
+    spot = np.asarray(spot, dtype='float64')
+    tariff = np.asarray(tariff, dtype='float64')
+    T = len(load)
+    t = np.arange(T)
+    col = {name: k * T + t for k, name in enumerate(VARIABLES)}
+    soc_gain = kW_to_kWh / ess_eff_kWh * 100
+
+    rows, cols, vals, row_lb, row_ub = [], [], [], [], []
+    n_rows = 0
+
+    def add_rows(terms, lo, hi, count=T, row_ids=None):
+        # terms: list of (column indices, coefficients) for `count` rows
+        nonlocal n_rows
+        r = n_rows + (t[:count] if row_ids is None else row_ids)
+        for c_idx, coef in terms:
+            rows.append(r)
+            cols.append(c_idx)
+            vals.append(np.broadcast_to(np.asarray(coef, dtype='float64'), r.shape))
+        row_lb.append(np.broadcast_to(np.asarray(lo, dtype='float64'), (count,)))
+        row_ub.append(np.broadcast_to(np.asarray(hi, dtype='float64'), (count,)))
+        n_rows += count
+
+    # Prohibit simultaneous PCC export and import
+    add_rows([(col["PCC_exp_z"], 1), (col["PCC_imp_z"], 1)], -np.inf, 1)
+    # PCC export calculation: EXPORT <= -exp_lim * exp_z
+    add_rows([(col["PCC_EXPORT_kW"], 1), (col["PCC_exp_z"], exp_lim_kW)], -np.inf, 0)
+    # PCC import calculation: IMPORT <= imp_lim * imp_z
+    add_rows([(col["PCC_IMPORT_kW"], 1), (col["PCC_imp_z"], -imp_lim_kW)], -np.inf, 0)
+    # Prohibit ESS simultaneous charging and discharging
+    add_rows([(col["ESS_kW_charge_z"], 1), (col["ESS_kW_discharge_z"], 1)], -np.inf, 1)
+    # ESS charge / discharge kW calculation
+    add_rows([(col["ESS_kW_charge"], 1), (col["ESS_kW_charge_z"], -ess_kW)], -np.inf, 0)
+    add_rows([(col["ESS_kW_discharge"], 1), (col["ESS_kW_discharge_z"], -ess_kW)], -np.inf, 0)
+    # ESS kW calculation
+    add_rows([(col["ESS_kW"], 1), (col["ESS_kW_charge"], -1), (col["ESS_kW_discharge"], 1)], 0, 0)
+    # ESS SOC calculation: SoC[0] == SOC_0, SoC[t] - SoC[t-1] - gain*ESS[t-1] == 0
+    add_rows([(col["ESS_SoC"][:1], 1)], soc_0, soc_0, count=1)
+    if T > 1:
+        add_rows([(col["ESS_SoC"][1:], 1), (col["ESS_SoC"][:-1], -1), (col["ESS_kW"][:-1], -soc_gain)], 0, 0, count=T - 1)
+    # End SoC value; free within [0, 100] when soc_end is None and valued in the objective instead
+    if soc_end is None:
+        add_rows([(col["ESS_SoC"][-1:], 1), (col["ESS_kW"][-1:], soc_gain)], 0, 100, count=1)
+    else:
+        add_rows([(col["ESS_SoC"][-1:], 1), (col["ESS_kW"][-1:], soc_gain)], soc_end, soc_end, count=1)
+    # Self consumption rule: IMPORT - EXPORT - ESS == P + PV
+    add_rows([(col["PCC_IMPORT_kW"], 1), (col["PCC_EXPORT_kW"], -1), (col["ESS_kW"], -1)], load + pv, load + pv)
+
+    n_cols = len(VARIABLES) * T
+    A = sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_rows, n_cols))
+
+    c = np.zeros(n_cols)
+    c[col["PCC_IMPORT_kW"]] = kW_to_kWh / 1000 * (spot / 1000 + tariff)
+    c[col["PCC_EXPORT_kW"]] = -kW_to_kWh / 1000 * spot / 1000
+    c[col["ESS_kW_charge"]] = kW_to_kWh / 1000 * deg_cost
+    if soc_end is None:
+        c[col["ESS_SoC"][-1]] -= soc_end_value
+        c[col["ESS_kW"][-1]] -= soc_end_value * soc_gain
+
+    lb = np.zeros(n_cols)
+    ub = np.full(n_cols, np.inf)
+    for name in BINARIES:
+        ub[col[name]] = 1
+    lb[col["ESS_kW"]] = -ess_kW
+    ub[col["ESS_kW"]] = ess_kW
+    ub[col["ESS_SoC"]] = 100
+
+    integrality = np.zeros(n_cols, dtype='int8')
+    for name in BINARIES:
+        integrality[col[name]] = 1
+
+    return MatrixModel(c, A, np.concatenate(row_lb), np.concatenate(row_ub), lb, ub, integrality, T)
+
+def _fmt(x):
+    return np.char.mod('%.12g', x)
+
+def write_mps(model, path):
+    "Write the model as free MPS in one pass over the CSC column arrays"
+    A = model.A.tocsc()
+    n_rows, n_cols = A.shape
+    row_names = np.char.add('R', np.arange(n_rows).astype(str))
+    col_names = np.char.add('C', np.arange(n_cols).astype(str))
+
+    equal = model.row_lb == model.row_ub
+    row_type = np.where(equal, 'E', np.where(np.isfinite(model.row_ub), 'L', 'G'))
+    rhs = np.where(np.isfinite(model.row_ub), model.row_ub, model.row_lb)
+    ranged = ~equal & np.isfinite(model.row_lb) & np.isfinite(model.row_ub)
+
+    # COLUMNS entries: objective coefficient first, then the matrix nonzeros of each column
+    entry_col = np.concatenate([np.flatnonzero(model.c), np.repeat(np.arange(n_cols), np.diff(A.indptr))])
+    entry_row = np.concatenate([np.full(np.count_nonzero(model.c), 'OBJ'), row_names[A.indices]])
+    entry_val = np.concatenate([model.c[model.c != 0], A.data])
+    order = np.argsort(entry_col, kind='stable')
+    entries = np.char.add(np.char.add(np.char.add(col_names[entry_col[order]], ' '), np.char.add(entry_row[order], ' ')), _fmt(entry_val[order]))
+    n_int = int(model.integrality.sum())
+    split = np.searchsorted(entry_col[order], n_int)   # integer columns are the leading block
+
+    lines = ['NAME ESS', 'ROWS', ' N OBJ']
+    lines += list(np.char.add(np.char.add(' ', row_type), np.char.add(' ', row_names)))
+    lines.append('COLUMNS')
+    if n_int:
+        lines.append(" MARKER 'MARKER' 'INTORG'")
+        lines += list(entries[:split])
+        lines.append(" MARKER 'MARKER' 'INTEND'")
+    lines += list(entries[split:])
+    lines.append('RHS')
+    nz = rhs != 0
+    lines += list(np.char.add(np.char.add(' RHS ', row_names[nz]), np.char.add(' ', _fmt(rhs[nz]))))
+    if ranged.any():
+        lines.append('RANGES')
+        width = (model.row_ub - model.row_lb)[ranged]
+        lines += list(np.char.add(np.char.add(' RNG ', row_names[ranged]), np.char.add(' ', _fmt(width))))
+    lines.append('BOUNDS')
+    lo_free = np.isneginf(model.lb)
+    lo_set = ~lo_free & (model.lb != 0)
+    up_set = np.isfinite(model.ub)
+    for kind, mask, vals in ((' MI BND ', lo_free, None), (' LO BND ', lo_set, model.lb), (' UP BND ', up_set, model.ub)):
+        if mask.any():
+            names = np.char.add(kind, col_names[mask])
+            lines += list(names if vals is None else np.char.add(np.char.add(names, ' '), _fmt(vals[mask])))
+    lines.append('ENDATA')
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+        f.write('\n')
+
+def read_glpsol_solution(path, n_cols):
+    "Parse a glpsol --write solution file (GLPK >= 4.57 format)"
+    x = np.zeros(n_cols)
+    status = None
+    objective = None
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 's':
+                kind = parts[1]
+                if kind == 'mip':
+                    status, objective = parts[4], float(parts[5])
+                else:   # bas / ipt: s <kind> rows cols pst dst obj; optimal when primal and dual feasible
+                    status = 'o' if parts[4] == parts[5] == 'f' else parts[4]
+                    objective = float(parts[6])
+            elif parts[0] == 'j':
+                j = int(parts[1]) - 1
+                # mip: j col val, bas: j col stat prim dual, ipt: j col prim dual
+                x[j] = float(parts[2] if kind == 'mip' else parts[3] if kind == 'bas' else parts[2])
+    return status, objective, x
+
+def unpack_solution(model, x, objective):
+    solution = {name: x[model.column(name)].copy() for name in VARIABLES}
+    solution["objective"] = objective
+    return solution
+
+def set_bound(solution, status, bound):
+    "Record the solve status, the dual bound and the relative gap of the incumbent"
+    objective = solution["objective"]
+    solution["status"] = status
+    solution["bound"] = bound if bound is not None and np.isfinite(bound) else None
+    solution["gap"] = (abs(objective - solution["bound"]) / max(abs(objective), 1e-9)
+                       if solution["bound"] is not None else None)
+    return solution
+
+def pack_solution(model, solution):
+    "Column vector of a solution dict, e.g. a warm start"
+    x = np.zeros(len(model.c))
+    for name in VARIABLES:
+        x[model.column(name)] = solution[name]
+    return x
+
+def solve_highs(model, time_limit=300, logger=None, relax=False, mip_gap=None, initial=None):
+    """Solve in-process with HiGHS through scipy.optimize.milp.
+
+    A MIP start (initial, a solution dict) needs the highspy bindings, which
+    scipy does not expose; without them the start is ignored.
+    """
+    if initial is not None and not relax:
+        if highspy is not None:
+            return solve_highspy(model, time_limit, logger, mip_gap, initial)
+        if logger:
+            logger.info("HiGHS MIP start needs highspy, warm start ignored")
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    options = {"time_limit": time_limit}
+    if mip_gap is not None:
+        options["mip_rel_gap"] = mip_gap
+    result = milp(model.c,
+                  integrality=np.zeros_like(model.integrality) if relax else model.integrality,
+                  bounds=Bounds(model.lb, model.ub),
+                  constraints=LinearConstraint(model.A, model.row_lb, model.row_ub),
+                  options=options)
+    # status 0 = optimal (within mip_gap), 1 = time/iteration limit; x is set whenever an incumbent exists
+    if result.x is None or result.status not in (0, 1):
+        if logger:
+            logger.debug(f"HiGHS finished with status {result.status}: {result.message}")
+        return None
+    solution = unpack_solution(model, result.x, float(result.fun))
+    bound = float(result.fun) if relax else getattr(result, "mip_dual_bound", None)
+    return set_bound(solution, "optimal" if result.status == 0 else "time_limit", bound)
+
+def solve_highspy(model, time_limit=300, logger=None, mip_gap=None, initial=None):
+    "Solve the MILP with the highspy bindings, starting from initial when given"
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    h.setOptionValue("time_limit", float(time_limit))
+    if mip_gap is not None:
+        h.setOptionValue("mip_rel_gap", float(mip_gap))
+    A = model.A.tocsc()
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = A.shape[1], A.shape[0]
+    lp.col_cost_, lp.col_lower_, lp.col_upper_ = model.c, model.lb, model.ub
+    lp.row_lower_, lp.row_upper_ = model.row_lb, model.row_ub
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = A.indptr, A.indices, A.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous for i in model.integrality]
+    h.passModel(lp)
+    if initial is not None:
+        start = highspy.HighsSolution()
+        start.col_value = pack_solution(model, initial).tolist()
+        start.value_valid = True
+        h.setSolution(start)
+    h.run()
+
+    status = h.getModelStatus()
+    info = h.getInfo()
+    limits = (highspy.HighsModelStatus.kTimeLimit, highspy.HighsModelStatus.kIterationLimit)
+    # primal_solution_status 2 = feasible; an incumbent exists
+    if info.primal_solution_status != 2 or (status != highspy.HighsModelStatus.kOptimal and status not in limits):
+        if logger:
+            logger.debug(f"HiGHS finished with status {h.modelStatusToString(status)}")
+        return None
+    objective = float(info.objective_function_value)
+    solution = unpack_solution(model, np.asarray(h.getSolution().col_value), objective)
+    return set_bound(solution, "optimal" if status == highspy.HighsModelStatus.kOptimal else "time_limit", info.mip_dual_bound)
+
+# Last branch-and-bound progress line: "+ 123: mip = 1.78e+00 >= 1.70e+00 4.6% (12; 0)"
+_GLPSOL_PROGRESS = re.compile(r"mip =\s*(\S+)\s*>=\s*(tree is empty|\S+)")
+
+def glpsol_bound(output, objective):
+    matches = _GLPSOL_PROGRESS.findall(output)
+    if not matches:
+        return None
+    bound = matches[-1][1]
+    if bound == "tree is empty":
+        return objective
+    try:
+        return float(bound)
+    except ValueError:
+        return None
+
+def solve_glpsol(model, executable='glpsol', time_limit=300, logger=None, relax=False, mip_gap=None):
+    with tempfile.TemporaryDirectory(prefix='ess_') as tmp:
+        mps_path = os.path.join(tmp, 'model.mps')
+        sol_path = os.path.join(tmp, 'model.sol')
+        write_mps(model, mps_path)
+        cmd = [executable, '--freemps', mps_path, '--min', '--tmlim', str(max(1, int(time_limit))), '-w', sol_path]
+        if relax:
+            cmd.append('--nomip')   # LP relaxation: integer columns treated as continuous
+        elif mip_gap is not None:
+            cmd += ['--mipgap', str(mip_gap)]
+        try:
+            # glpsol checks tmlim only between steps; kill it if it overruns under CPU contention
+            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=time_limit + 5)
+        except subprocess.TimeoutExpired:
+            if logger:
+                logger.warning(f"glpsol overran its {time_limit:.0f} s time limit and was stopped")
+            return None
+        except OSError as e:
+            if logger:
+                logger.warning(f"glpsol could not be started: {e}")
+            return None
+        if proc.returncode != 0 or not os.path.exists(sol_path):
+            if logger:
+                logger.debug(proc.stdout + proc.stderr)
+            return None
+        status, objective, x = read_glpsol_solution(sol_path, model.A.shape[1])
+
+    # o = optimal, f = feasible (MIP time limit reached with an incumbent, or basic LP solution)
+    if status not in ('o', 'f'):
+        if logger:
+            logger.debug(f"glpsol finished with status {status}")
+        return None
+    solution = unpack_solution(model, x, objective)
+    bound = objective if relax else glpsol_bound(proc.stdout, objective)
+    return set_bound(solution, "optimal" if status == 'o' else "time_limit", bound)
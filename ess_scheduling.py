@@ -1,9 +1,19 @@
 ### A5 ###
+import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from pyomo.environ import ConcreteModel, Var, Param, Set, NonNegativeReals, NonNegativeIntegers, Any, Constraint, Objective, SolverFactory, value, minimize, SolverStatus, TerminationCondition
-import pandas as pd
+from pyomo.environ import ConcreteModel, Var, Param, Set, NonNegativeReals, NonNegativeIntegers, UnitInterval, Any, Constraint, Objective, SolverFactory, value, minimize, TerminationCondition
+import os
 import pytz
+import shutil
+import time
+import ess_dp
+import ess_matrix_model
+from schedule_cache import cached_schedule
+import tracing
+
+GLPSOL_EXECUTABLE = r'/usr/bin/glpsol'
 
 def generate_schedule(lastProductionPrognosis, 
                     lastConsumptionPrognosis, 
@@ -21,14 +31,31 @@ def generate_schedule(lastProductionPrognosis,
                     ess_safe_min = 0.1,
                     pccImportLimitW = 20000,
                     pccExportLimitW = -15000,
-                    startTime = datetime.now(),
+                    startTime = None,          # time of the run, now when None
                     endTime = datetime.now() + timedelta(seconds=86400), # +24h
                     interval = 900, #15min
                     DAY_TARIFF = 0.07,
                     NIGHT_TARIFF = 0.05,
                     ESS_DEG_COST = 0.139,
                     local_timezone = pytz.timezone('Europe/Tallinn'),
-                    logger = None):
+                    logger = None,
+                    model_backend = "pyomo",       # pyomo, matrix or dp
+                    warm_start = True,             # MIP start; True: previous plan, "dp": DP plan, False: none. Used by highs and cbc, glpk ignores it
+                    solve_mode = "milp",
+                    horizon_window = None,     # seconds; solve overlapping windows when the horizon is longer
+                    horizon_overlap = 0,       # seconds of each window re-optimised by the next one
+                    schedule_cache = None,     # ScheduleCache; reuse the last plan when inputs are unchanged
+                    solver = "glpk",           # glpk, cbc or highs; glpk when the chosen one is not installed
+                    deadline = None,           # epoch seconds by which solving must be finished
+                    mip_gap = None,            # relative MIP gap at which the solver stops
+                    fallback = "dp",           # without a solution: "dp" plan, else the previous plan
+                    timings = None):
+
+    stage_start = time.perf_counter()
+    # Per-period diagnostics are only formatted when they are logged
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if startTime is None:
+        startTime = datetime.now()
 
     # Get production and consumption forecasts
     productionPrognosis = pd.DataFrame(lastProductionPrognosis) 
@@ -54,12 +81,12 @@ def generate_schedule(lastProductionPrognosis,
     npSpotPricePrognosis.index = pd.to_datetime(npSpotPricePrognosis.index, utc=True)
 
     # Insert NP price of current hour into dataset
-    currentHour = datetime.now().strftime("%Y-%m-%dT%H:00:00Z")
+    currentHour = startTime.strftime("%Y-%m-%dT%H:00:00Z")
     npSpotPricePrognosis.at[currentHour,'value'] = npSpotCurrentPrice
     npSpotPricePrognosis = npSpotPricePrognosis.sort_index()
     
     # Insert NP price of current hour into dataset
-    currentHour = datetime.now().strftime("%Y-%m-%dT%H:00:00Z")
+    currentHour = startTime.strftime("%Y-%m-%dT%H:00:00Z")
     npSpotPricePrognosis.at[currentHour,'value'] = npSpotCurrentPrice
     npSpotPricePrognosis = npSpotPricePrognosis.sort_index()
 
@@ -87,27 +114,22 @@ def generate_schedule(lastProductionPrognosis,
     ########### Prepare dataset with consumption, production, spot price, pcc, cost and tariff ###############
     dataset = npSpotPricePrognosis.copy().drop(columns=['id','datapointPrognosisId'])
     dataset = dataset.rename(columns={'value': 'spotprice'})
-    dataset['consumption'] = None
-    dataset['production'] = None
-    dataset['pcc'] = None
-    dataset['cost'] = None
-    dataset['tariff'] = None
-
     # Ensure index is UTC
     dataset.index = pd.to_datetime(dataset.index, utc=True)
-    
-    for index in dataset.index:
-        if index >  consumptionPrognosis.index[0]:
-
-            nearest_index = consumptionPrognosis.index.asof(index)
-            dataset.at[index,'consumption'] = consumptionPrognosis.loc[nearest_index, 'value']
-            dataset.at[index,'production'] = productionPrognosis.loc[nearest_index, 'value']
-            dataset.at[index,'pcc'] = consumptionPrognosis.loc[nearest_index, 'value'] + productionPrognosis.loc[nearest_index, 'value']
-            GRID_TARIFF_COMPONENT = NIGHT_TARIFF if (5 <= index.weekday() <= 6) or (index.hour >= 22 or index.hour < 7) else DAY_TARIFF
-            dataset.at[index,'cost'] = dataset.loc[index,'spotprice']/1000 * dataset.loc[index,'pcc']/1000 * (interval/3600) if dataset.loc[index,'pcc'] < 0 else (dataset.loc[index,'spotprice']/1000 + GRID_TARIFF_COMPONENT) * dataset.loc[index,'pcc']/1000 * (interval/3600)
-            dataset.at[index,'tariff'] = GRID_TARIFF_COMPONENT
-        else:
-            dataset = dataset.drop(index)
+    dataset['spotprice'] = dataset['spotprice'].astype('float64')
+
+    # Keep price periods after the first consumption value and align prognoses as-of each period
+    dataset = dataset[dataset.index > consumptionPrognosis.index[0]].copy()
+    nearest_index = consumptionPrognosis.index[consumptionPrognosis.index.searchsorted(dataset.index, side='right') - 1]
+    dataset['consumption'] = consumptionPrognosis.loc[nearest_index, 'value'].to_numpy(dtype='float64')
+    dataset['production'] = productionPrognosis.loc[nearest_index, 'value'].to_numpy(dtype='float64')
+    dataset['pcc'] = dataset['consumption'] + dataset['production']
+
+    dataset['tariff'] = grid_tariff(dataset.index, DAY_TARIFF, NIGHT_TARIFF)
+    dataset['cost'] = np.where(dataset['pcc'] < 0,
+                              dataset['spotprice']/1000,
+                              dataset['spotprice']/1000 + dataset['tariff']) * dataset['pcc']/1000 * (interval/3600)
+    dataset = dataset[['spotprice', 'consumption', 'production', 'pcc', 'cost', 'tariff']]
 
     # Convert to local timezone
     dataset.index = dataset.index.tz_convert(local_timezone)
@@ -115,11 +137,11 @@ def generate_schedule(lastProductionPrognosis,
     ########################### Extract and validate input #################################
     prod = dataset['production'].values 
     cons = dataset['consumption'].values 
-    np = dataset['spotprice'].values
+    nps = dataset['spotprice'].values
     tf = dataset['tariff'].values
 
     assert len(prod) == len(cons), "len(prod) != len(cons)"
-    assert len(prod) == len(np), "len(prod) != len(np)"
+    assert len(prod) == len(nps), "len(prod) != len(nps)"
     assert len(prod) == len(tf), "len(prod) != len(tf)"
 
     ############################ Parametrize model #############################
@@ -155,59 +177,395 @@ def generate_schedule(lastProductionPrognosis,
         ESS_SOC_0 = {ESS_SOC_0} %\n\
         ESS_SOC_END = {ESS_SOC_END} %')
     
-    prod_str = ", ".join(f"{x:.3f}" for x in prod)
-    logger.debug(f"Production values:\n[{prod_str}]")
+    if debug:
+        prod_str = ", ".join(f"{x:.3f}" for x in prod)
+        logger.debug(f"Production values:\n[{prod_str}]")
 
-    cons_str = ", ".join(f"{x:.3f}" for x in cons)
-    logger.debug(f"Consumption values:\n[{cons_str}]")
+        cons_str = ", ".join(f"{x:.3f}" for x in cons)
+        logger.debug(f"Consumption values:\n[{cons_str}]")
 
-    np_str = ", ".join(f"{x:.2f}" for x in np)
-    logger.debug(f"Spot price:\n[{np_str}]")
+        np_str = ", ".join(f"{x:.2f}" for x in nps)
+        logger.debug(f"Spot price:\n[{np_str}]")
 
-    tf_str = ", ".join(f"{x:.2f}" for x in tf)
-    logger.debug(f"Tariff:\n[{tf_str}]")
+        tf_str = ", ".join(f"{x:.2f}" for x in tf)
+        logger.debug(f"Tariff:\n[{tf_str}]")
     ########################################################################
 
-    ########################### Method for Converting Model Data to Pandas DataFrame #################################
-    def model_to_df(m):
-        st = 0
-        en = len(m.T)
-
-        periods = range(st, en)
-        load = [value(m.P_kW[i]) for i in periods]
-        pv = [value(m.PV_kW[i]) for i in periods]
-        pcc_export_kW = [value(m.PCC_EXPORT_kW[i]) for i in periods]
-        pcc_import_kW = [value(m.PCC_IMPORT_kW[i]) for i in periods]
-        ess = [value(m.ESS_kW[i]) for i in periods]
-        ess_soc = [value(m.ESS_SoC[i]) for i in periods]    
-        pcc = [value(m.PCC_IMPORT_kW[i])-value(m.PCC_EXPORT_kW[i]) for i in periods]
-        spot = [value(m.SPOT_EUR_kWh[i]) for i in periods]  
-        tariff = [value(m.TARIFF_EUR_kWh[i]) for i in periods] 
-
-        df_dict = {
-            'Period': periods,
-            'Load': load,
-            'PV': pv,
-            'ESS': ess,
-            'ESS effective SoC': ess_soc,
-            'PCC Export': pcc_export_kW,
-            'PCC Import': pcc_import_kW,
-            'PCC': pcc,
-            'Spot Price': spot,
-            'Grid tariff': tariff
-        }
-
-        df = pd.DataFrame(df_dict)
-
-        return df
+    stage_start = record_stage(timings, "dataset", stage_start)
 
     ########################### Build and Solve Model #################################
+    model_inputs = dict(
+        load=cons, pv=prod, spot=nps, tariff=tf,
+        ess_kW=ESS_kW, imp_lim_kW=P_imp_lim_kW, exp_lim_kW=P_exp_lim_kW,
+        kW_to_kWh=kW_to_kWh, ess_eff_kWh=ESS_eff_kWh,
+        soc_0=ESS_SOC_0, soc_end=ESS_SOC_END, deg_cost=ESS_DEG_COST)
+
+    # Reuse the last plan when nothing material changed since it was solved
+    if schedule_cache is not None:
+        plan = schedule_cache.lookup(dataset.index, model_inputs)
+        tracing.record("schedule.cache_hit" if plan is not None else "schedule.cache_miss", 0.0)
+        if plan is not None:
+            logger.info(f"Scheduling inputs unchanged, reusing stored plan (cache hits={schedule_cache.hits}, misses={schedule_cache.misses})")
+            return cached_schedule(dataset.index, plan)
+
+    # DP plan or the previous ESS plan shifted onto the new periods as initial solution
+    initial = None
+    if warm_start == "dp" and model_backend != "dp":
+        initial = solve_dp_model(model_inputs, logger)
+    guide = initial
+    if warm_start and initial is None:
+        initial = warm_start_solution(shift_plan(ess_e_lt, dataset.index), model_inputs)
+
+    window_periods = int(horizon_window // interval) if horizon_window else 0
+    if window_periods and len(cons) > window_periods:
+        solution = solve_receding_horizon(
+            model_inputs, window_periods, int(horizon_overlap // interval),
+            lambda inputs, initial, window_deadline: solve_model(
+                inputs, logger, model_backend, initial=initial, timings=timings, solve_mode=solve_mode, solver=solver,
+                deadline=window_deadline, mip_gap=mip_gap),
+            initial=initial, logger=logger, deadline=deadline, guide=guide)
+    else:
+        solution = solve_model(model_inputs, logger, model_backend, initial=initial, timings=timings, solve_mode=solve_mode, solver=solver,
+                               deadline=deadline, mip_gap=mip_gap)
+
+    if solution is None and fallback == "dp" and model_backend != "dp":
+        # No incumbent (solver missing, failed or out of time): dispatch by dynamic programming
+        logger.warning("No solver solution, falling back to the DP dispatcher")
+        solution = solve_dp_model(model_inputs, logger, timings=timings)
+        if solution is not None:
+            solution["status"] = "fallback_dp"
+
+    if solution is None:
+        # Keep following the previous plan, repaired onto the new periods
+        logger.warning("No solution within the time budget, falling back to the previous ESS plan")
+        solution = warm_start_solution(shift_plan(ess_e_lt, dataset.index), model_inputs)
+        solution["objective"] = solution_cost(model_inputs, solution)
+        ess_matrix_model.set_bound(solution, "fallback", None)
+    elif solution.get("status", "optimal") == "time_limit":
+        gap = f"{solution['gap']:.2%}" if solution.get("gap") is not None else "unknown"
+        logger.info(f"Solver stopped at the time limit with an incumbent, gap {gap}, bound {solution.get('bound')}")
+    stage_start = time.perf_counter()
+
+    imp_kW = float(np.sum(solution["PCC_IMPORT_kW"]))
+    exp_kW = float(np.sum(solution["PCC_EXPORT_kW"]))
+    if debug:
+        for i in range(len(cons)):
+            # Power components (kW)
+            imp = solution["PCC_IMPORT_kW"][i] / 1000
+            exp = solution["PCC_EXPORT_kW"][i] / 1000
+            p   = cons[i] / 1000
+            pv  = prod[i] / 1000
+
+            ess_c = solution["ESS_kW_charge"][i] / 1000
+            ess_d = solution["ESS_kW_discharge"][i] / 1000
+            ess   = solution["ESS_kW"][i] / 1000
+            soc   = solution["ESS_SoC"][i]
+
+            # Cost components
+            spot    = nps[i] / 1000
+            tariff  = tf[i]
+            imp_cost  = imp   * kW_to_kWh * (spot + tariff)
+            exp_cost  = exp   * kW_to_kWh * spot
+            ess_cost  = ess_c * kW_to_kWh * ESS_DEG_COST
+            total_cost = imp_cost - exp_cost + ess_cost
+
+            logger.debug(
+                f"PCC_EXPORT_kW[{i}] = {exp:.2f}; "
+                f"PCC_IMPORT_kW[{i}] = {imp:.2f}; "
+                f"P_kW[{i}] = {p:.2f}; "
+                f"PV_kW[{i}] = {pv:.2f}; "
+                f"ESS_C_kW[{i}] = {ess_c:.2f}; "
+                f"ESS_D_kW[{i}] = {ess_d:.2f}; "
+                f"ESS_kW[{i}] = {ess:.2f}; "
+                f"ESS SOC[{i}] = {soc:.1f}; "
+                f"COST = IMP ({imp_cost:.3f}) - EXP ({exp_cost:.3f}) "
+                f"+ ESS ({ess_cost:.3f}) = {total_cost:.2f}"
+            )
+
+    # Format results as data frame
+    results_df = solution_to_df(model_inputs, solution)
+    results_df["datetime"] = dataset.index
+
+    if debug:
+        logger.debug(f"Scheduling results: \n\
+                 {results_df}")
+    logger.info(f'<<< INITIAL COST = {dataset["cost"].sum():.2f} for {dataset["pcc"].sum()*kW_to_kWh/1000:.2f} kWh grid electricity >>> VS <<< TOTAL COST={solution["objective"]:.2f} for {(imp_kW-exp_kW)*kW_to_kWh/1000:.2f} kWh grid electricity>>>')
+    record_stage(timings, "extract", stage_start)
+
+    if schedule_cache is not None and not solution.get("status", "").startswith("fallback"):
+        schedule_cache.store(dataset.index, model_inputs, solution)
+
+    schedule = results_df[["datetime", "ESS"]]
+    schedule.attrs.update(cache_hit=False, solve_status=solution.get("status", "optimal"),
+                          mip_gap=solution.get("gap"), mip_bound=solution.get("bound"), objective=float(solution["objective"]))
+    return schedule
+
+def grid_tariff(index, day_tariff, night_tariff):
+    "Grid tariff per period of a UTC DatetimeIndex: night tariff on weekends and 22:00-07:00 (UTC)"
+    night = (index.weekday >= 5) | (index.hour >= 22) | (index.hour < 7)
+    return np.where(night, night_tariff, day_tariff).astype('float64')
+
+def record_stage(timings, name, stage_start, **attrs):
+    "Add the time since stage_start to timings[name] (if collecting) and return the new stage start"
+    now = time.perf_counter()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + now - stage_start
+    tracing.record(f"schedule.{name}", now - stage_start, **attrs)
+    return now
+
+def solve_model(model_inputs, logger, model_backend="pyomo", initial=None, timings=None, solve_mode="milp", solver="glpk",
+                deadline=None, mip_gap=None):
+    if model_backend == "matrix":
+        return solve_matrix_model(model_inputs, logger, initial=initial, timings=timings, solve_mode=solve_mode, solver=solver,
+                                  deadline=deadline, mip_gap=mip_gap)
+    elif model_backend == "pyomo":
+        return solve_pyomo_model(model_inputs, logger, initial=initial, timings=timings, solve_mode=solve_mode, solver=solver,
+                                 deadline=deadline, mip_gap=mip_gap)
+    elif model_backend == "dp":
+        return solve_dp_model(model_inputs, logger, timings=timings)
+    else:
+        raise ValueError(f"Unknown model backend: {model_backend}")
+
+########################### Solvers #################################
+SOLVERS = ("glpk", "cbc", "highs")
+SOLVER_TIME_LIMIT = 300     # seconds, upper bound of any single solve
+MIN_SOLVE_TIME = 1.0        # seconds; with less time left the solve is skipped
+
+def time_budget(deadline):
+    "Seconds a solve may take: the time left before deadline (epoch seconds), capped at SOLVER_TIME_LIMIT"
+    if deadline is None:
+        return SOLVER_TIME_LIMIT
+    return min(SOLVER_TIME_LIMIT, deadline - time.time())
+
+def glpsol_available():
+    return os.path.exists(GLPSOL_EXECUTABLE) or shutil.which(GLPSOL_EXECUTABLE) is not None
+
+def pyomo_solver(name, logger=None, time_limit=SOLVER_TIME_LIMIT, mip_gap=None):
+    """Pyomo solver for a backend name, the name actually used and extra solve() arguments.
+
+    Falls back to glpsol when the solver is not installed.
+    """
+    if name == "glpk":
+        options = {'tmlim': max(1, int(time_limit))}
+        if mip_gap is not None:
+            options['mipgap'] = mip_gap
+        # Subprocess solvers are killed when they overrun the limit, e.g. under CPU contention
+        return SolverFactory('glpk', options=options, executable=GLPSOL_EXECUTABLE), name, {"timelimit": time_limit + 5}
+    if name == "cbc":
+        solver, limit, gap, kwargs = SolverFactory('cbc'), 'seconds', 'ratioGap', {"timelimit": time_limit + 5}
+    elif name == "highs":
+        # In-process through the highspy bindings
+        solver, limit, gap, kwargs = SolverFactory('appsi_highs'), 'time_limit', 'mip_rel_gap', {}
+    else:
+        raise ValueError(f"Unknown solver: {name}")
+    if not solver.available(exception_flag=False):
+        if logger:
+            logger.warning(f"Solver {name} is not available, falling back to glpk")
+        return pyomo_solver("glpk", logger, time_limit, mip_gap)
+    solver.options[limit] = time_limit
+    if mip_gap is not None:
+        solver.options[gap] = mip_gap
+    return solver, name, kwargs
+
+def matrix_solver(name, logger=None):
+    "solve(model, relax=False, time_limit=..., mip_gap=None) for the matrix backend and the name actually used"
+    if name == "highs":
+        return lambda model, **kwargs: ess_matrix_model.solve_highs(model, logger=logger, **kwargs), name
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown solver: {name}")
+    if name != "glpk" and logger:
+        logger.warning(f"Solver {name} is not supported by the matrix backend, falling back to glpk")
+    return lambda model, **kwargs: ess_matrix_model.solve_glpsol(
+        model, executable=GLPSOL_EXECUTABLE, logger=logger, **kwargs), "glpk"
+
+def available_solvers(model_backend="pyomo"):
+    "Solver names usable with the model backend in this environment"
+    if model_backend == "matrix":
+        return [name for name in ("glpk", "highs") if name != "glpk" or glpsol_available()]
+    names = ["glpk"] if glpsol_available() else []
+    names += [name for name, factory in (("cbc", 'cbc'), ("highs", 'appsi_highs'))
+              if SolverFactory(factory).available(exception_flag=False)]
+    return names
+
+########################### Receding horizon #################################
+def solution_cost(model_inputs, solution):
+    "Objective cost terms (import, export, degradation) of a solution, without terminal SoC value"
+    kW_to_kWh = model_inputs["kW_to_kWh"]
+    spot = np.asarray(model_inputs["spot"], dtype='float64') / 1000
+    tariff = np.asarray(model_inputs["tariff"], dtype='float64')
+    return float(np.sum(solution["PCC_IMPORT_kW"] / 1000 * kW_to_kWh * (spot + tariff) -
+                        solution["PCC_EXPORT_kW"] / 1000 * kW_to_kWh * spot +
+                        solution["ESS_kW_charge"] / 1000 * kW_to_kWh * model_inputs["deg_cost"]))
+
+def soc_value(model_inputs, start, end):
+    "Value of one % of SoC at the end of a window: median spot price after the window, in EUR"
+    spot = np.asarray(model_inputs["spot"], dtype='float64')
+    future = spot[end:] if end < len(spot) else spot[start:end]
+    return float(np.median(future)) / 1000 * model_inputs["ess_eff_kWh"] / 1000 / 100
+
+def horizon_windows(T, window, overlap):
+    "(start, end, commit) of each receding-horizon window; a tail shorter than a window joins the window before it"
+    windows = []
+    start = 0
+    while start < T:
+        end = T if T - (start + window - overlap) < window else start + window
+        commit = end - start if end == T else window - overlap
+        windows.append((start, end, commit))
+        start += commit
+    return windows
+
+def solve_receding_horizon(model_inputs, window, overlap, solve, initial=None, logger=None, deadline=None, guide=None):
+    """Solve overlapping windows in sequence and stitch the committed periods.
+
+    Each window commits its first window - overlap periods, and the committed
+    end SoC becomes the next window's start SoC. A window ends at the SoC of a
+    full-horizon guide plan (the DP plan unless given), clipped to what the
+    window can reach, so soc_end stays reachable for the last window. Without a
+    guide plan the end SoC is free and valued at the median spot price of the
+    rest of the horizon. With a deadline, every window gets an equal share of
+    the time left.
+    """
+    if overlap >= window:
+        raise ValueError("horizon overlap must be shorter than the window")
+    series = ("load", "pv", "spot", "tariff")
+    T = len(model_inputs["load"])
+    gain = model_inputs["kW_to_kWh"] / model_inputs["ess_eff_kWh"] * 100
+    if guide is None:
+        plan = ess_dp.solve_dp(**model_inputs)
+        guide = plan_solution(plan, model_inputs) if plan is not None else None
+        if guide is None and logger:
+            logger.warning("No DP plan to guide the receding horizon, window end SoC is valued instead")
+    soc = model_inputs["soc_0"]
+    parts, statuses, gaps = [], [], []
+    windows = horizon_windows(T, window, overlap)
+    for i, (start, end, commit) in enumerate(windows):
+        last = end == T
+        inputs = {**model_inputs, **{k: np.asarray(model_inputs[k])[start:end] for k in series}, "soc_0": soc}
+        if not last and guide is not None:
+            reach = model_inputs["ess_kW"] * gain * (end - start)
+            inputs["soc_end"] = float(np.clip(guide["ESS_SoC"][end], max(0.0, soc - reach), min(100.0, soc + reach)))
+        elif not last:
+            inputs["soc_end"] = None
+            inputs["soc_end_value"] = soc_value(model_inputs, start, end)
+        window_initial = {k: initial[k][start:end] for k in ess_matrix_model.VARIABLES} if initial is not None else None
+        window_deadline = None
+        if deadline is not None:
+            # Time a window does not use carries over; small shares still get the minimum solve time
+            # plus as much again for building the window model
+            share = max(2 * MIN_SOLVE_TIME, (deadline - time.time()) / (len(windows) - i))
+            window_deadline = min(deadline, time.time() + share)
+
+        solution = solve(inputs, window_initial, window_deadline)
+        if solution is None:
+            if logger:
+                logger.warning(f"Receding horizon window {start}-{end} has no solution")
+            return None
+
+        parts.append({k: solution[k][:commit] for k in ess_matrix_model.VARIABLES})
+        statuses.append(solution.get("status", "optimal"))
+        gaps.append(solution.get("gap"))
+        if not last:
+            # SoC after the last committed period; with no overlap the window ends there
+            soc = float(solution["ESS_SoC"][commit - 1] + gain * solution["ESS_kW"][commit - 1])
+        if logger:
+            logger.debug(f"Receding horizon window {start}-{end}: committed {commit} periods, next SoC {soc:.1f} %")
+
+    stitched = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    stitched["objective"] = solution_cost(model_inputs, stitched)
+    # A stitched plan has no overall bound; report the worst window
+    stitched["status"] = "optimal" if all(st == "optimal" for st in statuses) else "time_limit"
+    stitched["bound"] = None
+    stitched["gap"] = None if None in gaps else max(gaps)
+    return stitched
+
+########################### Warm start #################################
+def shift_plan(ess_e_lt, index):
+    "Previous ESS plan value in force at each new period; 0 after the old plan ends"
+    if ess_e_lt.empty:
+        return np.zeros(len(index))
+    plan = ess_e_lt['value'].astype('float64').sort_index()
+    pos = plan.index.searchsorted(index, side='right') - 1
+    values = plan.to_numpy()[np.clip(pos, 0, None)]
+    step = plan.index[-1] - plan.index[-2] if len(plan) > 1 else pd.Timedelta(0)
+    values[(pos < 0) | (index > plan.index[-1] + step)] = 0
+    return values
+
+def warm_start_solution(plan, model_inputs):
+    "Repair a shifted ESS plan into a consistent assignment of all model variables"
+    ess_kW = model_inputs["ess_kW"]
+    gain = model_inputs["kW_to_kWh"] / model_inputs["ess_eff_kWh"] * 100
+    T = len(model_inputs["load"])
+    ess = np.clip(np.nan_to_num(np.asarray(plan, dtype='float64')), -ess_kW, ess_kW)
+
+    # Keep SoC within [0, 100] and steer the last period onto the end target
+    level = model_inputs["soc_0"]
+    for t in range(T):
+        if t == T - 1:
+            ess[t] = (model_inputs["soc_end"] - level) / gain
+        ess[t] = np.clip(ess[t], max(-ess_kW, -level / gain), min(ess_kW, (100 - level) / gain))
+        level += ess[t] * gain
+
+    return plan_solution(ess, model_inputs)
+
+def plan_solution(ess, model_inputs):
+    "All model variables for a feasible ESS plan, with the grid taking the rest of the load"
+    gain = model_inputs["kW_to_kWh"] / model_inputs["ess_eff_kWh"] * 100
+    soc = model_inputs["soc_0"] + gain * np.concatenate(([0.0], np.cumsum(ess[:-1])))
+    pcc = np.asarray(model_inputs["load"]) + np.asarray(model_inputs["pv"]) + ess
+    charge = np.maximum(ess, 0)
+    discharge = np.maximum(-ess, 0)
+    pcc_import = np.maximum(pcc, 0)
+    pcc_export = np.maximum(-pcc, 0)
+    return {
+        "ESS_kW": ess,
+        "ESS_kW_charge": charge,
+        "ESS_kW_discharge": discharge,
+        "ESS_kW_charge_z": (charge > 0).astype('float64'),
+        "ESS_kW_discharge_z": (discharge > 0).astype('float64'),
+        "ESS_SoC": soc,
+        "PCC_IMPORT_kW": pcc_import,
+        "PCC_EXPORT_kW": pcc_export,
+        "PCC_imp_z": (pcc_import > 0).astype('float64'),
+        "PCC_exp_z": (pcc_export > 0).astype('float64'),
+    }
+
+########################### Method for Converting Model Data to Pandas DataFrame #################################
+def solution_to_df(model_inputs, solution):
+    periods = range(0, len(model_inputs["load"]))
+
+    df_dict = {
+        'Period': periods,
+        'Load': model_inputs["load"],
+        'PV': model_inputs["pv"],
+        'ESS': solution["ESS_kW"],
+        'ESS effective SoC': solution["ESS_SoC"],
+        'PCC Export': solution["PCC_EXPORT_kW"],
+        'PCC Import': solution["PCC_IMPORT_kW"],
+        'PCC': solution["PCC_IMPORT_kW"] - solution["PCC_EXPORT_kW"],
+        'Spot Price': model_inputs["spot"],
+        'Grid tariff': model_inputs["tariff"]
+    }
+
+    df = pd.DataFrame(df_dict)
+
+    return df
+
+########################### Pyomo model #################################
+def build_pyomo_model(load, pv, spot, tariff, ess_kW, imp_lim_kW, exp_lim_kW, kW_to_kWh, ess_eff_kWh, soc_0, soc_end, deg_cost, soc_end_value=0.0):
+    ESS_kW = ess_kW
+    P_imp_lim_kW = imp_lim_kW
+    P_exp_lim_kW = exp_lim_kW
+    ESS_eff_kWh = ess_eff_kWh
+    ESS_SOC_0 = soc_0
+    ESS_SOC_END = soc_end
+    ESS_DEG_COST = deg_cost
+
     #### Prepare data as DataFrame
     data = pd.DataFrame({
-        'Load': cons,
-        'PV': prod,
-        'Spot': np,
-        'Tariff': tf
+        'Load': load,
+        'PV': pv,
+        'Spot': spot,
+        'Tariff': tariff
     })
     
     #### Initiate Model
@@ -284,9 +642,14 @@ def generate_schedule(lastProductionPrognosis,
 
     m.ess_SoC_const = Constraint(m.T, rule=ess_SoC_rule)
 
+    def end_soc(m):
+        return m.ESS_SoC[len(m.ESS_SoC)-1] + ((m.ESS_kW[len(m.ESS_SoC)-1]*kW_to_kWh)/ESS_eff_kWh)*100
+
     def soc_end_target_rule(m):
-        "End SoC value"
-        return m.ESS_SoC[len(m.ESS_SoC)-1] + ((m.ESS_kW[len(m.ESS_SoC)-1]*kW_to_kWh)/ESS_eff_kWh)*100 == ESS_SOC_END
+        "End SoC value (free within bounds when valued in the objective instead)"
+        if ESS_SOC_END is None:
+            return (0, end_soc(m), 100)
+        return end_soc(m) == ESS_SOC_END
 
     m.soc_end_target = Constraint(rule=soc_end_target_rule)
 
@@ -301,62 +664,188 @@ def generate_schedule(lastProductionPrognosis,
     cost = sum(( (m.PCC_IMPORT_kW[t]/1000)*kW_to_kWh*(m.SPOT_EUR_kWh[t]/1000 + m.TARIFF_EUR_kWh[t]) - 
                 (m.PCC_EXPORT_kW[t]/1000)*kW_to_kWh*m.SPOT_EUR_kWh[t]/1000 + 
                 (m.ESS_kW_charge[t]/1000)*kW_to_kWh*ESS_DEG_COST ) for t in m.T) #
+    if ESS_SOC_END is None:
+        cost = cost - soc_end_value*end_soc(m)
     m.objective = Objective(expr = cost, sense=minimize)
 
-    # Solver
-    solver = SolverFactory('glpk', options={'tmlim': 300} , executable=r'/usr/bin/glpsol')
-    results = solver.solve(m, tee=False)
-
+    return m
 
-    if (results.solver.status == SolverStatus.ok) and ((results.solver.termination_condition == TerminationCondition.optimal) or (results.solver.termination_condition == TerminationCondition.feasible)):
-        imp_kW = 0
-        exp_kW = 0
-        for i in m.PCC_EXPORT_kW:
-            # Power components (kW)
-            imp = m.PCC_IMPORT_kW[i]() / 1000
-            exp = m.PCC_EXPORT_kW[i]() / 1000
-            p   = m.P_kW[i] / 1000
-            pv  = m.PV_kW[i] / 1000
-
-            ess_c = m.ESS_kW_charge[i]() / 1000
-            ess_d = m.ESS_kW_discharge[i]() / 1000
-            ess   = m.ESS_kW[i]() / 1000
-            soc   = m.ESS_SoC[i]()
-
-            # Cost components
-            spot    = m.SPOT_EUR_kWh[i] / 1000
-            tariff  = m.TARIFF_EUR_kWh[i]
-            imp_cost  = imp   * kW_to_kWh * (spot + tariff)
-            exp_cost  = exp   * kW_to_kWh * spot
-            ess_cost  = ess_c * kW_to_kWh * ESS_DEG_COST
-            total_cost = imp_cost - exp_cost + ess_cost
+def solve_pyomo_model(model_inputs, logger, initial=None, timings=None, solve_mode="milp", lp_tol=1e-3, solver="glpk",
+                      deadline=None, mip_gap=None):
+    stage_start = time.perf_counter()
+    m = build_pyomo_model(**model_inputs)
 
-            logger.debug(
-                f"PCC_EXPORT_kW[{i}] = {exp:.2f}; "
-                f"PCC_IMPORT_kW[{i}] = {imp:.2f}; "
-                f"P_kW[{i}] = {p:.2f}; "
-                f"PV_kW[{i}] = {pv:.2f}; "
-                f"ESS_C_kW[{i}] = {ess_c:.2f}; "
-                f"ESS_D_kW[{i}] = {ess_d:.2f}; "
-                f"ESS_kW[{i}] = {ess:.2f}; "
-                f"ESS SOC[{i}] = {soc:.1f}; "
-                f"COST = IMP ({imp_cost:.3f}) - EXP ({exp_cost:.3f}) "
-                f"+ ESS ({ess_cost:.3f}) = {total_cost:.2f}"
-            )
-
-            imp_kW += m.PCC_IMPORT_kW[i]()
-            exp_kW += m.PCC_EXPORT_kW[i]()
-
-        # Format results as data frame
-        results_df = model_to_df(m)
-        results_df["datetime"] = dataset.index
-
-        logger.debug(f"Scheduling results: \n\
-                     {results_df}")
-        logger.info(f'<<< INITIAL COST = {dataset["cost"].sum():.2f} for {dataset["pcc"].sum()*kW_to_kWh/1000:.2f} kWh grid electricity >>> VS <<< TOTAL COST={value(m.objective()):.2f} for {(imp_kW-exp_kW)*kW_to_kWh/1000:.2f} kWh grid electricity>>>')
-        
-        return results_df[["datetime", "ESS"]] 
-    else:    
-        logger.debug(results.write())
-
-        return None    
\ No newline at end of file
+    # Solver
+    solver_name = pyomo_solver(solver, logger)[1]
+    if timings is not None:
+        timings["solver"] = solver_name
+    if initial is not None:
+        for name in ess_matrix_model.VARIABLES:
+            var, values = getattr(m, name), initial[name]
+            for t in m.T:
+                var[t].set_value(values[t], skip_validation=True)
+    stage_start = record_stage(timings, "model_build", stage_start)
+
+    def solve(warmstart=False):
+        # Returns the incumbent with its status, bound and gap, or None
+        time_limit = time_budget(deadline)
+        if time_limit < MIN_SOLVE_TIME:
+            logger.warning(f"{time_limit:.1f} s left before the solve deadline, solve skipped")
+            return None
+        opt, _, kwargs = pyomo_solver(solver_name, logger, time_limit, mip_gap)
+        if warmstart:
+            if opt.warm_start_capable():
+                kwargs["warmstart"] = True
+            else:
+                logger.info(f"{solver_name} does not accept a MIP start, warm start ignored")
+        try:
+            results = opt.solve(m, tee=False, load_solutions=False, **kwargs)
+        except Exception as e:
+            logger.warning(f"{solver_name} solve failed: {e}")
+            return None
+        if not solver_succeeded(results):
+            logger.debug(f"{solver_name} finished with {results.solver.status} / {results.solver.termination_condition}")
+            return None
+        m.solutions.load_from(results)
+        return pyomo_solution(m, results)
+
+    if solve_mode == "lp_first":
+        # Continuous relaxation first; binaries may take any value in [0, 1]
+        for name in ess_matrix_model.BINARIES:
+            for v in getattr(m, name).values():
+                v.domain = UnitInterval
+        solution = solve()
+        stage_start = record_stage(timings, "solve", stage_start, solver=solver_name)
+        if solution is not None:
+            violations = complementarity_violations(solution, lp_tol)
+            if not violations.any():
+                solution.update(binaries_from_flows(solution, lp_tol))
+                record_stage(timings, "extract", stage_start)
+                logger.debug("LP relaxation is integral, MILP solve skipped")
+                return solution
+
+            # Re-solve as MILP with the binaries of consistent periods fixed
+            logger.info(f"LP relaxation violates complementarity in {violations.sum()} of {len(violations)} periods, re-solving as MILP")
+            fixed = binaries_from_flows(solution, lp_tol)
+            active = {"PCC_imp_z": solution["PCC_IMPORT_kW"] > lp_tol, "PCC_exp_z": solution["PCC_EXPORT_kW"] > lp_tol,
+                      "ESS_kW_charge_z": solution["ESS_kW_charge"] > lp_tol, "ESS_kW_discharge_z": solution["ESS_kW_discharge"] > lp_tol}
+            pcc_fix = ~violations & (active["PCC_imp_z"] | active["PCC_exp_z"])
+            ess_fix = ~violations & (active["ESS_kW_charge_z"] | active["ESS_kW_discharge_z"])
+            for name in ess_matrix_model.BINARIES:
+                mask = pcc_fix if name.startswith("PCC") else ess_fix
+                var = getattr(m, name)
+                for t in m.T:
+                    var[t].domain = NonNegativeIntegers
+                    if mask[t]:
+                        var[t].fix(fixed[name][t])
+        else:
+            logger.debug("LP relaxation failed, solving as MILP")
+            for name in ess_matrix_model.BINARIES:
+                for v in getattr(m, name).values():
+                    v.domain = NonNegativeIntegers
+        stage_start = time.perf_counter()
+
+    solution = solve(warmstart=initial is not None)
+    stage_start = record_stage(timings, "solve", stage_start, solver=solver_name)
+    if solution is not None:
+        record_stage(timings, "extract", stage_start)
+    return solution
+
+# Time and iteration limits still leave a usable incumbent
+ACCEPTED_TERMINATIONS = (TerminationCondition.optimal, TerminationCondition.feasible,
+                         TerminationCondition.maxTimeLimit, TerminationCondition.maxIterations)
+
+def solver_succeeded(results):
+    return len(results.solution) > 0 and results.solver.termination_condition in ACCEPTED_TERMINATIONS
+
+def pyomo_solution(m, results=None):
+    solution = {name: np.array([value(getattr(m, name)[t]) for t in m.T], dtype='float64')
+                for name in ess_matrix_model.VARIABLES}
+    solution["objective"] = value(m.objective())
+    if results is None:
+        return solution
+    optimal = results.solver.termination_condition == TerminationCondition.optimal
+    try:
+        bound = float(results.problem.lower_bound)
+    except (TypeError, ValueError):
+        bound = None
+    return ess_matrix_model.set_bound(solution, "optimal" if optimal else "time_limit", bound)
+
+########################### Matrix model #################################
+def solve_matrix_model(model_inputs, logger, initial=None, timings=None, solve_mode="milp", lp_tol=1e-3, solver="glpk",
+                       deadline=None, mip_gap=None):
+    stage_start = time.perf_counter()
+    solver_solve, solver_name = matrix_solver(solver, logger)
+    if timings is not None:
+        timings["solver"] = solver_name
+    if initial is not None and solver_name != "highs":
+        logger.info(f"{solver_name} does not accept a MIP start, warm start ignored")
+        initial = None
+
+    def solve(model, relax=False):
+        time_limit = time_budget(deadline)
+        if time_limit < MIN_SOLVE_TIME:
+            logger.warning(f"{time_limit:.1f} s left before the solve deadline, solve skipped")
+            return None
+        start = {"initial": initial} if initial is not None and not relax else {}
+        return solver_solve(model, relax=relax, time_limit=time_limit, mip_gap=mip_gap, **start)
+
+    model = ess_matrix_model.build_matrices(**model_inputs)
+    stage_start = record_stage(timings, "model_build", stage_start)
+
+    if solve_mode == "lp_first":
+        solution = solve(model, relax=True)
+        stage_start = record_stage(timings, "solve", stage_start, solver=solver_name)
+        if solution is not None:
+            violations = complementarity_violations(solution, lp_tol)
+            if not violations.any():
+                solution.update(binaries_from_flows(solution, lp_tol))
+                logger.debug("LP relaxation is integral, MILP solve skipped")
+                return solution
+
+            # Re-solve as MILP with the binaries of consistent periods fixed
+            logger.info(f"LP relaxation violates complementarity in {violations.sum()} of {len(violations)} periods, re-solving as MILP")
+            fixed = binaries_from_flows(solution, lp_tol)
+            pcc_fix = ~violations & ((solution["PCC_IMPORT_kW"] > lp_tol) | (solution["PCC_EXPORT_kW"] > lp_tol))
+            ess_fix = ~violations & ((solution["ESS_kW_charge"] > lp_tol) | (solution["ESS_kW_discharge"] > lp_tol))
+            lb, ub = model.lb.copy(), model.ub.copy()
+            for name in ess_matrix_model.BINARIES:
+                mask = pcc_fix if name.startswith("PCC") else ess_fix
+                cols = np.arange(model.column(name).start, model.column(name).stop)[mask]
+                lb[cols] = ub[cols] = fixed[name][mask]
+            model = model._replace(lb=lb, ub=ub)
+
+    solution = solve(model)
+    record_stage(timings, "solve", stage_start, solver=solver_name)
+    return solution
+
+########################### DP dispatcher #################################
+def solve_dp_model(model_inputs, logger, timings=None):
+    "Near-optimal plan by dynamic programming over a SoC grid; no dual bound, so no gap"
+    stage_start = time.perf_counter()
+    if timings is not None:
+        timings["solver"] = "dp"
+    plan = ess_dp.solve_dp(**model_inputs)
+    stage_start = record_stage(timings, "solve", stage_start, solver="dp")
+    if plan is None:
+        logger.warning("DP dispatcher found no plan within the PCC and SoC limits")
+        return None
+    solution = plan_solution(plan, model_inputs)
+    solution["objective"] = solution_cost(model_inputs, solution)
+    record_stage(timings, "extract", stage_start)
+    return ess_matrix_model.set_bound(solution, "heuristic", None)
+
+########################### LP relaxation checks #################################
+def complementarity_violations(solution, tol=1e-3):
+    "Periods where the solution imports and exports, or charges and discharges, at the same time"
+    return (((solution["PCC_IMPORT_kW"] > tol) & (solution["PCC_EXPORT_kW"] > tol)) |
+            ((solution["ESS_kW_charge"] > tol) & (solution["ESS_kW_discharge"] > tol)))
+
+def binaries_from_flows(solution, tol=1e-3):
+    "Binary values implied by the continuous flows"
+    return {
+        "PCC_imp_z": (solution["PCC_IMPORT_kW"] > tol).astype('float64'),
+        "PCC_exp_z": (solution["PCC_EXPORT_kW"] > tol).astype('float64'),
+        "ESS_kW_charge_z": (solution["ESS_kW_charge"] > tol).astype('float64'),
+        "ESS_kW_discharge_z": (solution["ESS_kW_discharge"] > tol).astype('float64'),
+    }
@@ -3,6 +3,9 @@
 import logging
 import requests
 import json
+import os
+import queue
+import threading
 import time
 
 def normalize_log_level(raw_level):
@@ -32,38 +35,187 @@ def normalize_log_level(raw_level):
     return logging.INFO
 
 class LokiHandler(logging.Handler):
-    def __init__(self, url, tags=None, level=logging.NOTSET):
+    """Ships log records to Loki from a background thread.
+
+    emit() only formats the record and puts it on a bounded queue. The worker
+    thread batches queued entries into one push per stream and flushes when
+    batch_size entries are collected or flush_interval seconds have passed.
+    When the queue is full or a push fails, entries are appended to spill_file
+    (if given), otherwise they are dropped and counted in self.dropped. Spilled
+    entries are re-shipped once a push succeeds again and only removed from the
+    file after they were sent.
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, url, tags=None, level=logging.NOTSET, batch_size=200, flush_interval=2.0,
+                 queue_size=10000, spill_file=None, timeout=5):
         super().__init__(level)
         self.url = url
         self.tags = tags or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self.timeout = timeout
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._session = requests.Session()
+        self._spill_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._worker, name="loki-shipper", daemon=True)
+        self._thread.start()
 
     def emit(self, record):
         try:
-            log_entry = self.format(record)
-            ts = str(int(time.time() * 1e9))  # nanoseconds timestamp
-            payload = {
-                "streams": [
-                    {
-                        "stream": self.tags,
-                        "values": [[ts, log_entry]],
-                    }
-                ]
-            }
-            response = requests.post(
+            entry = [str(int(record.created * 1e9)), self.format(record)]  # nanoseconds timestamp
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self._overflow(entry)
+
+    def flush(self, timeout=None):
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put((self._FLUSH, done), timeout=timeout or self.timeout)
+        except queue.Full:
+            return
+        done.wait(timeout or self.timeout * 2)
+
+    def close(self):
+        if self._thread.is_alive():
+            try:
+                self.queue.put(self._STOP, timeout=self.timeout)
+            except queue.Full:
+                pass
+            self._thread.join(self.timeout * 2)
+        self._session.close()
+        super().close()
+
+    def _overflow(self, entry):
+        self._spill([entry])
+
+    def _spill(self, entries):
+        if self.spill_file:
+            try:
+                with self._spill_lock, open(self.spill_file, "a") as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in entries)
+                return
+            except OSError:
+                pass
+        self.dropped += len(entries)
+
+    def _ship(self, batch):
+        # A batch Loki did not accept goes to the spill file
+        if self._push(batch):
+            return True
+        self._spill(batch)
+        return False
+
+    def _drain_spill(self):
+        "Push spilled entries; the file keeps the unsent ones and those appended meanwhile"
+        if not self.spill_file or not os.path.exists(self.spill_file):
+            return
+        try:
+            with self._spill_lock, open(self.spill_file, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"[LokiHandler] Failed to read spill file {self.spill_file}: {e}")
+            return
+
+        lines = data.splitlines(keepends=True)
+        sent = 0
+        for i in range(0, len(lines), self.batch_size):
+            chunk = lines[i:i + self.batch_size]
+            entries = []
+            for line in chunk:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    self.dropped += 1   # a torn or corrupt line is never sendable
+            if not self._push(entries):
+                break
+            sent = i + len(chunk)
+        if not sent:
+            return
+
+        with self._spill_lock:
+            try:
+                with open(self.spill_file, "rb") as f:
+                    f.seek(len(data))
+                    rest = b"".join(lines[sent:]) + f.read()
+                if rest:
+                    tmp_path = f"{self.spill_file}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(rest)
+                    os.replace(tmp_path, self.spill_file)
+                else:
+                    os.remove(self.spill_file)
+            except OSError as e:
+                print(f"[LokiHandler] Failed to update spill file {self.spill_file}: {e}")
+
+    def _push(self, values):
+        if not values:
+            return True
+        payload = {
+            "streams": [
+                {
+                    "stream": self.tags,
+                    "values": values,
+                }
+            ]
+        }
+        try:
+            response = self._session.post(
                 self.url,
                 data=json.dumps(payload),
                 headers={"Content-Type": "application/json"},
-                timeout=5,
+                timeout=self.timeout,
             )
             response.raise_for_status()
+            return True
         except Exception as e:
-            print(f"[LokiHandler] Failed to send log to Loki: {e}")
+            print(f"[LokiHandler] Failed to send {len(values)} log entries to Loki: {e}")
+            return False
+
+    def _worker(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is None or item is self._STOP or isinstance(item, tuple):
+                if self._ship(batch) and self.queue.empty():
+                    self._drain_spill()
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if isinstance(item, tuple):
+                    item[1].set()
+                if item is self._STOP:
+                    return
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._ship(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
 
-def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki_url=None, loki_tags=None, level=logging.INFO):
+def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki_url=None, loki_tags=None, level=logging.INFO,
+                 loki_spill_file=None):
     log_level = normalize_log_level(level)
     
     logger = logging.getLogger(app_name)
     logger.setLevel(log_level)
+    for handler in logger.handlers:
+        handler.close()
     logger.handlers = []  # Clear existing handlers if rerun
 
     # File Handler
@@ -80,7 +232,7 @@ def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki
 
     # Loki Handler (optional)
     if loki_url:
-        loki_handler = LokiHandler(url=loki_url, tags=loki_tags)
+        loki_handler = LokiHandler(url=loki_url, tags=loki_tags, spill_file=loki_spill_file)
         loki_handler.setLevel(log_level)
         loki_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
         logger.addHandler(loki_handler)
@@ -1,9 +1,15 @@
 import query_utils
 import argparse
+import os
+import signal
+import threading
+import time
 import yaml
 from datetime import datetime, timezone, timedelta
 import pytz
 import ess_scheduling
+import tracing
+from schedule_cache import ScheduleCache
 from logger import setup_logger
 
 #######################################################################
@@ -11,63 +17,128 @@ from logger import setup_logger
 #######################################################################
 APP_NAME = "dsxos-app-test"
 
-# create parser
-parser = argparse.ArgumentParser(description=f"Run {APP_NAME} with config file")
-parser.add_argument("-c", "--config", required=False, help="Path to config YAML file", default="/app/config.yaml")
-args = parser.parse_args() # Read arguments
-with open(args.config, "r") as f: # Open and read config-file
-    raw_data = yaml.safe_load(f)
-    
-# Extract API URL and Token
-api_url = raw_data['params']['apiEndpoint']
-api_token = raw_data['params']['token']
-api_headers = {"Authorization": api_token}
-
-# Initialize logger with central logging to Loki
-logger = setup_logger(
-    log_file="query.log",
-    loki_url="http://localhost:3100/loki/api/v1/push",  # Loki address
-    loki_tags={"app_name": APP_NAME},        # add more tags if needed
-    level=raw_data["logLevel"]    
-)
-
-# Initialize query_utils with URL + headers    
-query_utils.init(api_url, api_headers, logger)
-
-# Log passed arguments 
-logger.debug(f"{APP_NAME} run with arguments: %s", raw_data)
+def load_config(path):
+    with open(path, "r") as f: # Open and read config-file
+        return yaml.safe_load(f)
+
+def init_logger(raw_data):
+    # Initialize logger with central logging to Loki
+    return setup_logger(
+        log_file="query.log",
+        loki_url="http://localhost:3100/loki/api/v1/push",  # Loki address
+        loki_tags={"app_name": APP_NAME},        # add more tags if needed
+        level=raw_data["logLevel"]    
+    )
+
+# Params init_query_utils reads; a change of any of them rebuilds the session and caches
+QUERY_UTILS_PARAMS = ('apiEndpoint', 'token', 'http_pool_size', 'http_retries', 'bulk_readings_endpoint',
+                      'upload_chunk_size', 'upload_concurrency', 'prognosis_page_size', 'prognosis_as_columns',
+                      'prognosis_cache_path', 'prognosis_cache_max_mb')
+
+def init_query_utils(raw_data, logger):
+    # Extract API URL and Token
+    api_url = raw_data['params']['apiEndpoint']
+    api_token = raw_data['params']['token']
+    api_headers = {"Authorization": api_token}
+
+    # Initialize query_utils with URL + headers    
+    query_utils.init(api_url, api_headers, logger,
+                     pool_size=raw_data['params'].get('http_pool_size', 10),
+                     retries=raw_data['params'].get('http_retries', 3),
+                     bulk_readings_endpoint=raw_data['params'].get('bulk_readings_endpoint'),
+                     upload_chunk_size=raw_data['params'].get('upload_chunk_size', 50),
+                     upload_concurrency=raw_data['params'].get('upload_concurrency', 4),
+                     prognosis_page_size=raw_data['params'].get('prognosis_page_size', 1000),
+                     prognosis_as_columns=raw_data['params'].get('prognosis_as_columns', False),
+                     prognosis_cache_path=raw_data['params'].get('prognosis_cache_path'),
+                     prognosis_cache_max_mb=raw_data['params'].get('prognosis_cache_max_mb', 256))
 
 #######################################################################
 #### APPLICATION
 #######################################################################
-# Generate ESS schedule
-try:
-    schedule = ess_scheduling.generate_schedule(
-                    lastProductionPrognosis = query_utils.get_last_prognosis_readings(raw_data['params']['production_p_lt_DP_ID']), 
-                    lastConsumptionPrognosis = query_utils.get_last_prognosis_readings(raw_data['params']['consumption_p_lt_DP_ID']), 
-                    lastNpSpotPricePrognosis = query_utils.get_last_prognosis_readings(raw_data['params']['elering_nps_price_DP_ID']), 
-                    npSpotCurrentPrice = query_utils.get_last_reading_value(raw_data['params']['elering_nps_price_DP_ID']), 
-                    lastEss_e_lt = query_utils.get_last_prognosis_readings(raw_data['params']['ess_e_lt_DP_ID'], generate_if_missing=True), 
-                    ess_p = query_utils.get_last_reading_value(raw_data['params']['ess_p_DP_ID']) ,
-                    ess_charge = query_utils.get_last_reading_value(raw_data['params']['ess_charge_DP_ID']),
-                    ess_charge_end = query_utils.get_last_reading_value(raw_data['params']['ess_charge_end_DP_ID']),
-                    ess_soc = query_utils.get_last_reading_value(raw_data['params']['ess_avg_SOC_DP_ID']),
-                    ess_max_p = query_utils.get_last_reading_value(raw_data['params']['ess_max_p_DP_ID']),
-                    ess_max_e = query_utils.get_last_reading_value(raw_data['params']['ess_max_e_DP_ID']),
-                    ess_soc_min = raw_data['params']['ess_soc_min'], 
-                    ess_soc_max = raw_data['params']['ess_soc_max'],
-                    ess_safe_min = query_utils.get_last_reading_value(raw_data['params']['ess_min_batt_safe_lim_DP_ID'])*100,
-                    pccImportLimitW = query_utils.get_last_reading_value(raw_data['params']['pccImportLimitW_DP_ID']), #100000,
-                    pccExportLimitW = query_utils.get_last_reading_value(raw_data['params']['pccExportLimitW_DP_ID']), #-100000,
-                    startTime = datetime.now(),
-                    endTime = datetime.now() + timedelta(seconds=86400), # +24h
-                    interval = raw_data['params']['interval'], #900, #15min
-                    DAY_TARIFF = raw_data['params']['DAY_TARIFF'], #0.07,
-                    NIGHT_TARIFF = raw_data['params']['NIGHT_TARIFF'], #0.05,
-                    ESS_DEG_COST = raw_data['params']['ESS_DEG_COST'], #0.139,
-                    local_timezone = pytz.timezone(raw_data['params']['timezone']),
-                    logger = logger)            
+def run_schedule(raw_data, logger):
+    # Per-cycle tracing summary as log line and optional OpenMetrics textfile
+    metrics_file = raw_data['params'].get('metrics_file')
+    tracing.enable(bool(raw_data['params'].get('tracing', False) or metrics_file))
+    tracing.reset()
+    with tracing.span("main.cycle"):
+        schedule_cycle(raw_data, logger)
+    tracing.log_summary(logger)
+    if metrics_file:
+        try:
+            tracing.write_openmetrics(metrics_file, {"app": APP_NAME})
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {metrics_file}: {e}")
+
+def fetch_schedule_inputs(raw_data):
+    # Resolve all configured datapoint identifiers with one bulk query
+    with tracing.span("main.preload"):
+        query_utils.preload_datapoints(v for k, v in raw_data['params'].items() if k.endswith('_DP_ID'))
+
+    # Fetch all scheduling inputs concurrently
+    with tracing.span("main.fetch"):
+        return query_utils.fetch_inputs(
+                        query_utils.schedule_input_spec(raw_data['params']),
+                        max_workers = raw_data['params'].get('fetch_concurrency', 8))
+
+# Schedule caches per site, kept across daemon cycles
+_schedule_caches = {}
+
+def get_schedule_cache(raw_data):
+    params = raw_data['params']
+    if not (params.get('schedule_cache') or params.get('schedule_cache_file')):
+        return None
+    tolerances = params.get('schedule_cache_tolerances') or {}
+    key = (params['apiEndpoint'], params['ess_e_lt_DP_ID'], params.get('schedule_cache_file'), tuple(sorted(tolerances.items())))
+    if key not in _schedule_caches:
+        _schedule_caches[key] = ScheduleCache(params.get('schedule_cache_file'), tolerances)
+    return _schedule_caches[key]
 
+def schedule_arguments(raw_data, inputs, logger):
+    # Keyword arguments of ess_scheduling.generate_schedule
+    return dict(
+                lastProductionPrognosis = inputs.lastProductionPrognosis, 
+                lastConsumptionPrognosis = inputs.lastConsumptionPrognosis, 
+                lastNpSpotPricePrognosis = inputs.lastNpSpotPricePrognosis, 
+                npSpotCurrentPrice = inputs.npSpotCurrentPrice, 
+                lastEss_e_lt = inputs.lastEss_e_lt, 
+                ess_p = inputs.ess_p,
+                ess_charge = inputs.ess_charge,
+                ess_charge_end = inputs.ess_charge_end,
+                ess_soc = inputs.ess_soc,
+                ess_max_p = inputs.ess_max_p,
+                ess_max_e = inputs.ess_max_e,
+                ess_soc_min = raw_data['params']['ess_soc_min'], 
+                ess_soc_max = raw_data['params']['ess_soc_max'],
+                ess_safe_min = inputs.ess_safe_min*100,
+                pccImportLimitW = inputs.pccImportLimitW, #100000,
+                pccExportLimitW = inputs.pccExportLimitW, #-100000,
+                startTime = datetime.now(),
+                endTime = datetime.now() + timedelta(seconds=86400), # +24h
+                interval = raw_data['params']['interval'], #900, #15min
+                DAY_TARIFF = raw_data['params']['DAY_TARIFF'], #0.07,
+                NIGHT_TARIFF = raw_data['params']['NIGHT_TARIFF'], #0.05,
+                ESS_DEG_COST = raw_data['params']['ESS_DEG_COST'], #0.139,
+                local_timezone = pytz.timezone(raw_data['params']['timezone']),
+                logger = logger,
+                model_backend = raw_data['params'].get('model_backend', 'pyomo'),
+                solve_mode = raw_data['params'].get('solve_mode', 'milp'),
+                horizon_window = raw_data['params'].get('horizon_window'),
+                horizon_overlap = raw_data['params'].get('horizon_overlap', 0),
+                solver = raw_data['params'].get('solver', 'glpk'),
+                deadline = solve_deadline(raw_data),
+                mip_gap = raw_data['params'].get('mip_gap'),
+                warm_start = raw_data['params'].get('warm_start', True),
+                fallback = raw_data['params'].get('fallback', 'dp'),
+                schedule_cache = get_schedule_cache(raw_data))
+
+def solve_deadline(raw_data, now=None):
+    "Epoch seconds by which solving must finish so the plan is posted before the next interval starts"
+    params = raw_data['params']
+    now = time.time() if now is None else now
+    return next_run_time(now, params['interval'], params.get('daemon_offset', 0)) - params.get('post_margin', 30)
+
+def post_schedule(raw_data, schedule, logger):
     if (len(schedule) == 0):
         # Handle empty schedule case
         logger.warning(f'Optimization failed - empty result. Prognosis not updated.')
@@ -75,15 +146,9 @@ try:
         logger.debug("ESS Schedule: "+", ".join(f"{dt} = {ess:.4g}" for dt, ess in zip(schedule["datetime"], schedule["ESS"])))
 
     # Prepare prognosis payload data based on generated schedule
-    essPowerPlan =[]
-    for _, row in schedule.iterrows():
-        dt = row['datetime']
-        utc_dt = dt.astimezone(timezone.utc) 
-        value = row['ESS'] 
-        essPowerPlan.append({
-            "time": utc_dt.isoformat().replace('+00:00', 'Z'),
-            "value": value
-        })
+    essPowerPlan = query_utils.encode_prognosis_readings(
+        schedule["datetime"].dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[s]"),
+        schedule["ESS"].to_numpy())
 
     # Construct the prognosis payload with datapoint ID, timestamp, and payload data
     prognosis_payload = {
@@ -93,13 +158,107 @@ try:
     }
 
     # POST datapoint prognosis
-    response = query_utils.post_datapoint_prognosis(prognosis_payload)
+    with tracing.span("main.post"):
+        response = query_utils.post_datapoint_prognosis(prognosis_payload)
     logger.debug(f"Posted prognosis for datapoint {raw_data['params']['ess_e_lt_DP_ID']}; Response: {response}")
-    
-except Exception as e:
-    logger.error(f'Error generating ESS schedule: {e}')
+    return response
+
+def schedule_cycle(raw_data, logger):
+    # Log passed arguments 
+    logger.debug(f"{APP_NAME} run with arguments: %s", raw_data)
+
+    # Generate ESS schedule
+    try:
+        inputs = fetch_schedule_inputs(raw_data)
+
+        with tracing.span("main.schedule"):
+            schedule = ess_scheduling.generate_schedule(**schedule_arguments(raw_data, inputs, logger))
+
+        if schedule is None:
+            logger.warning("No ESS schedule generated, prognosis not updated")
+            return
+
+        if schedule.attrs.get("cache_hit"):
+            logger.info("ESS schedule unchanged, posted plan kept")
+            return
+
+        try:
+            post_schedule(raw_data, schedule, logger)
+        except Exception:
+            # The stored plan never reached the API; solve and post again next cycle
+            cache = get_schedule_cache(raw_data)
+            if cache is not None:
+                cache.clear()
+            raise
+
+    except Exception as e:
+        logger.error(f'Error generating ESS schedule: {e}')
+
+#######################################################################
+#### DAEMON MODE
+#######################################################################
+def next_run_time(now, interval, offset=0):
+    "Next interval boundary (plus offset seconds) strictly after now, as epoch seconds"
+    return (int(now - offset) // interval + 1) * interval + offset
+
+def run_daemon(config_path, raw_data, logger):
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    config_mtime = os.stat(config_path).st_mtime
+    next_run = time.time()
+    while not stop.wait(max(0.0, next_run - time.time())):
+        # Reload config on change; keep session, caches and logger unless their settings changed
+        mtime = os.stat(config_path).st_mtime
+        if mtime != config_mtime:
+            try:
+                new_data = load_config(config_path)
+            except Exception as e:
+                logger.error(f"Config reload failed, keeping previous config: {e}")
+            else:
+                if new_data["logLevel"] != raw_data["logLevel"]:
+                    logger = init_logger(new_data)
+                if any(new_data['params'].get(k) != raw_data['params'].get(k) for k in QUERY_UTILS_PARAMS):
+                    init_query_utils(new_data, logger)
+                raw_data = new_data
+                logger.info(f"Config reloaded from {config_path}")
+            config_mtime = mtime
+
+        # Runs are sequential, so a slow run skips the boundaries it overran instead of overlapping
+        started = time.time()
+        run_schedule(raw_data, logger)
+        interval = raw_data['params']['interval']
+        next_run = next_run_time(time.time(), interval, raw_data['params'].get('daemon_offset', 0))
+        missed = int((time.time() - started) // interval)
+        if missed:
+            logger.warning(f"Scheduling run took {time.time() - started:.1f} s, skipped {missed} interval(s)")
+
+    logger.info(f"{APP_NAME} daemon stopped")
 
 #######################################################################
-#### FINALIZATION
+#### MAIN
 #######################################################################
-logger.info(f"{APP_NAME} executed")
\ No newline at end of file
+def main():
+    # create parser
+    parser = argparse.ArgumentParser(description=f"Run {APP_NAME} with config file")
+    parser.add_argument("-c", "--config", required=False, help="Path to config YAML file", default="/app/config.yaml")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and re-schedule every interval")
+    args = parser.parse_args() # Read arguments
+    raw_data = load_config(args.config)
+
+    logger = init_logger(raw_data)
+    init_query_utils(raw_data, logger)
+
+    if args.daemon:
+        run_daemon(args.config, raw_data, logger)
+    else:
+        run_schedule(raw_data, logger)
+
+    #######################################################################
+    #### FINALIZATION
+    #######################################################################
+    logger.info(f"{APP_NAME} executed")
+
+if __name__ == "__main__":
+    main()
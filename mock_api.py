@@ -0,0 +1,592 @@
+### Local stand-in for the DSxOS API ###
+# Serves the endpoints Query/query_utils use from in-memory fixture data, with
+# the API's criteria filters (field.equals, field.in, ...), page/size
+# pagination capped at a maximum page size, sort=field,direction and the
+# X-Total-Count header. Latency, jitter, error rates and the page-size cap are
+# set globally or per endpoint. The load mode runs many app instances against
+# the server and reports request rates and tail latencies.
+#
+#   python mock_api.py serve --port 8080 --latency-ms 20 --error-rate 0.01
+#   python mock_api.py load --instances 16 --cycles 3 --jitter-ms 50
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import signal
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import yaml
+import benchmark
+import tracing
+from Query import dumps_json
+
+ENTITIES = ("datapoints", "readings", "datapoint-prognoses", "prognosis-readings", "control-values")
+# Fields with a lookup index; the app filters on these with equals/in
+INDEXED = {
+    "datapoints": ("identifier",),
+    "readings": ("datapointId",),
+    "datapoint-prognoses": ("datapointId",),
+    "prognosis-readings": ("datapointPrognosisId",),
+    "control-values": ("datapointId",),
+}
+DEFAULT_PAGE_SIZE = 20
+STATS_PATH = "/__stats"
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+
+#######################################################################
+#### FAULT PROFILES
+#######################################################################
+class EndpointProfile(NamedTuple):
+    latency_ms: float = 0.0         # fixed delay before every response
+    jitter_ms: float = 0.0          # mean of an exponential extra delay, gives a latency tail
+    error_rate: float = 0.0         # share of requests answered with one of error_statuses
+    error_statuses: tuple = (500, 502, 503)
+    max_page_size: int = 2000       # larger requested page sizes are capped, as by the API
+
+    def delay(self, rnd):
+        jitter = rnd.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+def load_profiles(path, default):
+    """Default and per-endpoint profiles from a YAML file.
+
+    Top-level keys are `default`, an endpoint (`/readings`) or a method and
+    endpoint (`POST /prognosis-readings`); endpoint entries override the default.
+    """
+    with open(path, "r") as f:
+        data = yaml.safe_load(f) or {}
+
+    def profile(base, values):
+        values = dict(values or {})
+        if "error_statuses" in values:
+            values["error_statuses"] = tuple(values["error_statuses"])
+        return base._replace(**values)
+
+    default = profile(default, data.pop("default", None))
+    return default, {key: profile(default, values) for key, values in data.items()}
+
+#######################################################################
+#### FIXTURE STORE
+#######################################################################
+class Criterion:
+    "One `field.operator=value` filter; values are compared as numbers or booleans unless the field holds strings"
+    __slots__ = ("field", "op", "raw", "parsed")
+    OPERATORS = ("equals", "notEquals", "in", "notIn", "greaterThan", "lessThan",
+                 "greaterThanOrEqual", "lessThanOrEqual", "specified", "contains", "doesNotContain")
+
+    def __init__(self, field, op, texts):
+        if op not in self.OPERATORS:
+            raise ApiError(400, f"Unsupported filter operator: {field}.{op}")
+        if op in ("in", "notIn"):
+            texts = [t for text in texts for t in text.split(",")]
+        self.field, self.op = field, op
+        self.raw = texts
+        self.parsed = [_parse(t) for t in texts]
+
+    def test(self, record):
+        value = record.get(self.field)
+        args = self.raw if isinstance(value, str) else self.parsed
+        op = self.op
+        if op == "specified":
+            return (value is not None) == bool(self.parsed[0])
+        if value is None:
+            return op in ("notEquals", "notIn", "doesNotContain")
+        try:
+            if op == "equals":
+                return value == args[0]
+            if op == "notEquals":
+                return value != args[0]
+            if op == "in":
+                return value in args
+            if op == "notIn":
+                return value not in args
+            if op == "greaterThan":
+                return value > args[0]
+            if op == "lessThan":
+                return value < args[0]
+            if op == "greaterThanOrEqual":
+                return value >= args[0]
+            if op == "lessThanOrEqual":
+                return value <= args[0]
+        except TypeError:
+            return False
+        contained = self.raw[0].lower() in str(value).lower()
+        return contained if op == "contains" else not contained
+
+def _parse(text):
+    if text in ("true", "false"):
+        return text == "true"
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+class Store:
+    """
+    In-memory entities with auto-assigned ids.
+
+    Field names in filters and sorts match case-insensitively (the app sends
+    `Id.equals`); filters on fields no record has are ignored, as by the API.
+    """
+
+    def __init__(self, fixture=None):
+        self._lock = threading.Lock()
+        self._tables = {entity: {} for entity in ENTITIES}
+        self._fields = {entity: {"id": "id"} for entity in ENTITIES}
+        self._index = {entity: {field: defaultdict(list) for field in INDEXED[entity]} for entity in ENTITIES}
+        self._next_id = dict.fromkeys(ENTITIES, 1)
+        for entity, records in (fixture or {}).items():
+            if entity not in self._tables:
+                raise ValueError(f"Unknown fixture entity: {entity}")
+            for record in records:
+                self._insert(entity, dict(record))
+
+    def _insert(self, entity, record):
+        if record.get("id") is None:
+            record["id"] = self._next_id[entity]
+        self._next_id[entity] = max(self._next_id[entity], record["id"] + 1)
+        self._tables[entity][record["id"]] = record
+        for field in record:
+            self._fields[entity].setdefault(field.lower(), field)
+        for field, index in self._index[entity].items():
+            index[record.get(field)].append(record)
+        return record
+
+    def create(self, entity, payload):
+        "Store one record or a list of records; returns the stored copies"
+        records = payload if isinstance(payload, list) else [payload]
+        if not all(isinstance(r, dict) for r in records):
+            raise ApiError(400, "Request body must be a JSON object or a list of objects")
+        with self._lock:
+            created = [dict(self._insert(entity, {k: v for k, v in r.items() if k != "id"})) for r in records]
+        return created if isinstance(payload, list) else created[0]
+
+    def create_prognosis(self, payload):
+        "Store a datapoint prognosis without its embedded readings and make it the datapoint's last prognosis"
+        if not isinstance(payload, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        with self._lock:
+            prognosis = self._insert("datapoint-prognoses", {k: v for k, v in payload.items() if k not in ("id", "readings")})
+            datapoint = self._tables["datapoints"].get(prognosis.get("datapointId"))
+            if datapoint is not None:
+                datapoint["lastPrognosisId"] = prognosis["id"]
+            return dict(prognosis)
+
+    def dump(self):
+        "All records per entity, in the fixture format"
+        with self._lock:
+            return {entity: [dict(r) for r in table.values()] for entity, table in self._tables.items()}
+
+    def set_sent(self, payload):
+        "Mark control values sent, by id, list of ids or records, or all unsent ones of a datapointId"
+        if isinstance(payload, dict):
+            items = payload.get("ids", [payload.get("id")])
+        else:
+            items = payload if isinstance(payload, list) else [payload]
+        ids = [item.get("id") if isinstance(item, dict) else item for item in items]
+        with self._lock:
+            table = self._tables["control-values"]
+            if isinstance(payload, dict) and "datapointId" in payload:
+                records = [r for r in self._index["control-values"]["datapointId"].get(payload["datapointId"], [])
+                           if not r.get("sent")]
+            else:
+                records = [table[i] for i in ids if i in table]
+            for record in records:
+                record["sent"] = True
+            return [dict(r) for r in records]
+
+    def query(self, entity, params, max_page_size):
+        "One page of filtered, sorted records and the total match count"
+        fields = self._fields[entity]
+        criteria = []
+        for key, texts in params.items():
+            if key in ("page", "size", "sort") or "." not in key:
+                continue
+            name, op = key.rsplit(".", 1)
+            field = fields.get(name.lower())
+            if field is not None:
+                criteria.append(Criterion(field, op, texts))
+
+        try:
+            page = int(params.get("page", ["0"])[0])
+            size = min(int(params.get("size", [str(DEFAULT_PAGE_SIZE)])[0]), max_page_size)
+        except ValueError:
+            raise ApiError(400, "page and size must be integers")
+        if page < 0 or size < 1:
+            raise ApiError(400, "page must be >= 0 and size >= 1")
+
+        with self._lock:
+            matches = [r for r in self._candidates(entity, criteria) if all(c.test(r) for c in criteria)]
+        # Later sort keys first, so the first one decides; default is id order
+        for sort in reversed(params.get("sort") or ["id,asc"]):
+            name, _, direction = sort.partition(",")
+            field = fields.get(name.lower(), name)
+            matches.sort(key=lambda r: (r.get(field) is None, r.get(field)), reverse=direction.lower() == "desc")
+        return [dict(r) for r in matches[page * size:(page + 1) * size]], len(matches)
+
+    def _candidates(self, entity, criteria):
+        # Narrow the scan with the id or an indexed equals/in filter
+        table = self._tables[entity]
+        for c in criteria:
+            if c.op not in ("equals", "in"):
+                continue
+            if c.field == "id":
+                return [table[i] for i in dict.fromkeys(c.parsed) if i in table]
+            index = self._index[entity].get(c.field)
+            if index is not None:
+                found = {}
+                for raw, parsed in zip(c.raw, c.parsed):
+                    for record in index.get(parsed, []) + (index.get(raw, []) if raw != parsed else []):
+                        found[record["id"]] = record
+                return list(found.values())
+        return list(table.values())
+
+def _timestamp(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# Reading values of a synthetic site per config param; ess_e_lt starts without a prognosis
+SITE_READINGS = {
+    "ess_p_DP_ID": 0.0, "ess_charge_DP_ID": 5000.0, "ess_charge_end_DP_ID": 5000.0, "ess_avg_SOC_DP_ID": 0.5,
+    "ess_max_p_DP_ID": 5000.0, "ess_max_e_DP_ID": 10000.0, "ess_min_batt_safe_lim_DP_ID": 0.1,
+    "pccImportLimitW_DP_ID": 20000.0, "pccExportLimitW_DP_ID": -15000.0,
+}
+SITE_PROGNOSES = ("production_p_lt_DP_ID", "consumption_p_lt_DP_ID", "elering_nps_price_DP_ID")
+
+def site_identifier(identifier, site, sites):
+    return identifier if sites == 1 else f"{identifier}-{site}"
+
+def synthetic_fixture(params, sites=1, horizon_h=36, interval_min=15, seed=0):
+    "Datapoints, readings, prognoses and control values of synthetic sites for the *_DP_ID identifiers in params"
+    now = datetime.now(timezone.utc)
+    start_time = now.replace(minute=0, second=0, microsecond=0)
+    store = Store()
+    for site in range(sites):
+        prognoses = dict(zip(SITE_PROGNOSES, benchmark.synthetic_prognoses(horizon_h, interval_min, seed + site, start_time)))
+        for key, identifier in sorted(params.items()):
+            if not key.endswith("_DP_ID"):
+                continue
+            dp = store.create("datapoints", {"identifier": site_identifier(identifier, site, sites), "lastPrognosisId": None})
+            if key in prognoses:
+                prognosis = store.create_prognosis({"datapointId": dp["id"], "time": _timestamp(now)})
+                store.create("prognosis-readings", [{"time": r["time"], "value": r["value"], "datapointPrognosisId": prognosis["id"]}
+                                                    for r in prognoses[key]])
+            value = prognoses[key][0]["value"] if key == "elering_nps_price_DP_ID" else SITE_READINGS.get(key)
+            if value is not None:
+                store.create("readings", {"datapointId": dp["id"], "time": _timestamp(now), "value": value})
+            if key == "ess_p_DP_ID":
+                store.create("control-values", {"datapointId": dp["id"], "time": _timestamp(now), "value": 0.0, "sent": False})
+    return store.dump()
+
+#######################################################################
+#### HTTP SERVER
+#######################################################################
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, as the app's pooled sessions expect
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        started = time.perf_counter()
+        server = self.server
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if url.path == STATS_PATH:
+            self._reply(200, server.stats())
+            return
+
+        endpoint = url.path[len(server.prefix):] if url.path.startswith(server.prefix) else url.path
+        profile = server.profile(method, endpoint)
+        delay = profile.delay(server.random)
+        if delay:
+            time.sleep(delay)
+        if profile.error_rate and server.random.random() < profile.error_rate:
+            status = server.random.choice(profile.error_statuses)
+            payload, headers = {"title": "Injected failure", "status": status}, {}
+        else:
+            try:
+                status, payload, headers = server.route(method, endpoint, url, body, profile)
+            except ApiError as e:
+                status, payload, headers = e.status, {"title": str(e), "status": e.status}, {}
+        self._reply(status, payload, headers)
+        server.record(method, endpoint, status, time.perf_counter() - started)
+
+    def _reply(self, status, payload, headers=None):
+        data = dumps_json(payload) if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256        # many app instances connect at once
+
+    def __init__(self, address, store, default_profile=EndpointProfile(), profiles=None, prefix="/api",
+                 bulk_endpoint="/prognosis-readings/bulk", seed=None):
+        super().__init__(address, MockHandler)
+        self.store = store
+        self.default_profile = default_profile
+        self.profiles = profiles or {}
+        self.prefix = prefix.rstrip("/")
+        self.bulk_endpoint = bulk_endpoint
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.requests = []          # (method, endpoint, status, seconds) per request
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def profile(self, method, endpoint):
+        return self.profiles.get(f"{method} {endpoint}") or self.profiles.get(endpoint) or self.default_profile
+
+    def route(self, method, endpoint, url, body, profile):
+        "Status, JSON payload and extra headers of a request"
+        entity = endpoint.lstrip("/")
+        if method == "GET" and entity in ENTITIES:
+            records, total = self.store.query(entity, parse_qs(url.query, keep_blank_values=True), profile.max_page_size)
+            return 200, records, {"X-Total-Count": str(total)}
+        if method != "POST":
+            raise ApiError(404 if entity not in ENTITIES else 405, f"No route for {method} {endpoint}")
+
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON")
+        if endpoint == "/datapoint-prognoses":
+            return 201, self.store.create_prognosis(payload), {}
+        if endpoint == "/control-values/set-sent":
+            return 200, self.store.set_sent(payload), {}
+        if endpoint == self.bulk_endpoint:
+            return 201, self.store.create("prognosis-readings", payload), {}
+        if entity in ENTITIES:
+            return 201, self.store.create(entity, payload), {}
+        raise ApiError(404, f"No route for {method} {endpoint}")
+
+    def record(self, method, endpoint, status, seconds):
+        self.requests.append((method, endpoint, status, seconds))
+
+    def stats(self):
+        return latency_table(list(self.requests), time.monotonic() - self.started)
+
+def start_server(store, host="127.0.0.1", port=0, **options):
+    "A MockServer serving in a daemon thread; port 0 picks a free port"
+    server = MockServer((host, port), store, **options)
+    threading.Thread(target=server.serve_forever, name="mock-api", daemon=True).start()
+    return server
+
+#######################################################################
+#### STATISTICS
+#######################################################################
+def _is_error(status):
+    return not isinstance(status, int) or status >= 400
+
+def latency_table(requests, elapsed):
+    "Count, rate, errors and latency percentiles per method and endpoint from (method, endpoint, status, seconds) rows"
+    groups = defaultdict(list)
+    for method, endpoint, status, seconds in requests:
+        groups[(method, endpoint)].append((status, seconds))
+    table = []
+    for (method, endpoint), rows in sorted(groups.items(), key=lambda item: (str(item[0][1]), str(item[0][0]))):
+        ms = np.array([seconds for _, seconds in rows]) * 1000
+        p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+        table.append({
+            "method": method, "endpoint": endpoint, "count": len(rows),
+            "per_s": round(len(rows) / max(elapsed, 1e-9), 3),
+            "errors": sum(_is_error(status) for status, _ in rows),
+            "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3),
+        })
+    return table
+
+def print_table(title, table):
+    print(title)
+    print(f"  {'method':<6} {'endpoint':<28} {'count':>7} {'req/s':>8} {'errors':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in table:
+        print(f"  {row['method']:<6} {row['endpoint']:<28} {row['count']:>7} {row['per_s']:>8.1f} {row['errors']:>6} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+#######################################################################
+#### LOAD GENERATOR
+#######################################################################
+# Site settings of the built-in config; identifiers are mock.<param name>
+DEFAULT_PARAMS = dict(
+    {key: f"mock.{key[:-len('_DP_ID')]}" for key in (*SITE_PROGNOSES, "ess_e_lt_DP_ID", *SITE_READINGS)},
+    token="mock", interval=900, ess_soc_min=10, ess_soc_max=90,
+    DAY_TARIFF=0.07, NIGHT_TARIFF=0.05, ESS_DEG_COST=0.139, timezone="Europe/Tallinn", model_backend="dp",
+)
+
+def site_config(raw_data, site, sites, api_url):
+    "Config of one app instance: the site's identifiers and the mock's URL"
+    params = {k: site_identifier(v, site, sites) if k.endswith("_DP_ID") else v for k, v in raw_data['params'].items()}
+    return {**raw_data, "params": {**params, "apiEndpoint": api_url, "token": params.get("token") or "mock"}}
+
+class _ErrorCount(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def _run_instance(raw_data, cycles, pause_s, log_level):
+    "Run schedule cycles of one app instance; returns cycle durations, logged errors and the HTTP request spans"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import main
+    logger = logging.getLogger("mock-api-instance")
+    logger.handlers = []
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    errors = _ErrorCount()
+    logger.addHandler(handler)
+    logger.addHandler(errors)
+    logger.setLevel(log_level)
+    logger.propagate = False
+
+    main.init_query_utils(raw_data, logger)
+    tracing.enable(True)
+    active_from = time.time()
+    cycle_s = []
+    for cycle in range(cycles):
+        if cycle and pause_s:
+            time.sleep(pause_s)
+        started = time.perf_counter()
+        main.schedule_cycle(raw_data, logger)
+        cycle_s.append(time.perf_counter() - started)
+    requests = [(s.attrs.get("method"), s.attrs.get("endpoint"), s.attrs.get("status"), s.duration)
+                for s in tracing.spans() if s.name == "http.request"]
+    return {"cycle_s": cycle_s, "errors": errors.count, "requests": requests, "active": (active_from, time.time())}
+
+def run_load(server, raw_data, instances, cycles=3, pause_s=0.0, log_level=logging.ERROR):
+    "Drive concurrent app instances against the server; client- and server-side request statistics"
+    # Spawned, not forked: the parent runs the server threads
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=instances, mp_context=context) as pool:
+        futures = [pool.submit(_run_instance, site_config(raw_data, site, instances, server.url), cycles, pause_s, log_level)
+                   for site in range(instances)]
+        for future in as_completed(futures):
+            results.append(future.result())
+    elapsed = time.perf_counter() - started
+    # Rates over the time instances were cycling, without process start-up
+    active = max(r["active"][1] for r in results) - min(r["active"][0] for r in results)
+
+    requests = [row for r in results for row in r["requests"]]
+    cycle_s = np.array([s for r in results for s in r["cycle_s"]])
+    return {
+        "instances": instances,
+        "cycles": cycles,
+        "elapsed_s": round(elapsed, 3),
+        "requests": len(requests),
+        "active_s": round(active, 3),
+        "requests_per_s": round(len(requests) / active, 3),
+        "logged_errors": sum(r["errors"] for r in results),
+        "cycle_s": {"p50": round(float(np.percentile(cycle_s, 50)), 3), "p95": round(float(np.percentile(cycle_s, 95)), 3),
+                    "max": round(float(cycle_s.max()), 3)},
+        "client": latency_table(requests, active),
+        "server": latency_table(list(server.requests), active),
+    }
+
+#######################################################################
+#### MAIN
+#######################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Local DSxOS API stand-in with latency and failure injection")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--host", default="127.0.0.1")
+    common.add_argument("--prefix", default="/api", help="Path prefix of the API, as in apiEndpoint")
+    common.add_argument("--fixture", help="JSON file with a list of records per entity (default: synthetic sites)")
+    common.add_argument("-c", "--config", help="App config YAML whose *_DP_ID identifiers the synthetic fixture uses")
+    common.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay per response")
+    common.add_argument("--jitter-ms", type=float, default=0.0, help="Mean exponential extra delay per response")
+    common.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with an error status")
+    common.add_argument("--error-statuses", type=int, nargs="+", default=[500, 502, 503])
+    common.add_argument("--max-page-size", type=int, default=2000, help="Cap on the requested page size")
+    common.add_argument("--profiles", help="YAML file with default and per-endpoint latency/error profiles")
+    common.add_argument("--bulk-endpoint", default="/prognosis-readings/bulk", help="Path accepting lists of prognosis readings")
+    common.add_argument("--seed", type=int, default=None)
+    modes = parser.add_subparsers(dest="mode", required=True)
+    serve = modes.add_parser("serve", parents=[common], help="Serve the mock API until interrupted")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--sites", type=int, default=1, help="Synthetic sites; identifiers get a -<site> suffix when more than one")
+    serve.add_argument("--save-fixture", help="Also write the served fixture as JSON")
+    load = modes.add_parser("load", parents=[common], help="Run concurrent app instances against a local mock")
+    load.add_argument("--port", type=int, default=0)
+    load.add_argument("-n", "--instances", type=int, default=8, help="Concurrent app instances, one synthetic site each")
+    load.add_argument("--cycles", type=int, default=3, help="Schedule cycles per instance")
+    load.add_argument("--pause", type=float, default=0.0, help="Seconds between an instance's cycles")
+    load.add_argument("-o", "--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    raw_data = {"logLevel": "ERROR", "params": dict(DEFAULT_PARAMS)}
+    if args.config:
+        with open(args.config, "r") as f:
+            raw_data = yaml.safe_load(f)
+    sites = args.sites if args.mode == "serve" else args.instances
+    if args.fixture:
+        with open(args.fixture, "r") as f:
+            fixture = json.load(f)
+    else:
+        fixture = synthetic_fixture(raw_data['params'], sites, seed=args.seed or 0)
+    if args.mode == "serve" and args.save_fixture:
+        with open(args.save_fixture, "w") as f:
+            json.dump(fixture, f)
+
+    default = EndpointProfile(args.latency_ms, args.jitter_ms, args.error_rate, tuple(args.error_statuses), args.max_page_size)
+    profiles = {}
+    if args.profiles:
+        default, profiles = load_profiles(args.profiles, default)
+    server = start_server(Store(fixture), args.host, args.port, default_profile=default, profiles=profiles,
+                          prefix=args.prefix, bulk_endpoint=args.bulk_endpoint, seed=args.seed)
+
+    if args.mode == "serve":
+        print(f"Mock DSxOS API at {server.url} ({sum(len(v) for v in fixture.values())} fixture records); "
+              f"statistics at http://{args.host}:{server.server_address[1]}{STATS_PATH}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        server.shutdown()
+        print_table("Requests served", server.stats())
+        return
+
+    report = run_load(server, raw_data, args.instances, args.cycles, args.pause)
+    server.shutdown()
+    print(f"{report['instances']} instances x {report['cycles']} cycles in {report['active_s']:.1f} s: "
+          f"{report['requests']} requests ({report['requests_per_s']:.1f}/s), {report['logged_errors']} logged errors, "
+          f"cycle p50 {report['cycle_s']['p50']:.2f} s, p95 {report['cycle_s']['p95']:.2f} s")
+    print_table("Client side (incl. retries)", report["client"])
+    print_table("Server side (incl. injected delay)", report["server"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,143 @@
-from Query import Query
+from Query import Query, get_session
 import Util
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, List, NamedTuple
 
 _query_url = None
 _query_headers = None
+_query_session = None
 
-def init(url, headers, logger=None):
-    global _query_url, _query_headers, _logger
+# Prognosis readings upload: bulk endpoint (if the API has one) or chunked concurrent POSTs
+_bulk_readings_endpoint = None
+_upload_chunk_size = 50
+_upload_concurrency = 4
+
+# Datapoint metadata cache: identifier -> {"data": dp, "loaded": t, "prognosis_loaded": t}
+_dp_cache = {}
+_dp_cache_lock = threading.Lock()
+_dp_cache_ttl = 3600        # seconds a cached datapoint is served without re-query
+_prognosis_id_ttl = 60      # seconds a cached lastPrognosisId is trusted
+
+# Prognosis readings download: page size and whether readings are returned as numpy columns
+_prognosis_page_size = 1000
+_prognosis_as_columns = False
+_prognosis_cache = None         # PrognosisCache when a cache path is configured
+
+def init(url, headers, logger=None, cache_ttl=3600, prognosis_id_ttl=60,
+         pool_size=10, retries=3, backoff_factor=0.5,
+         bulk_readings_endpoint=None, upload_chunk_size=50, upload_concurrency=4,
+         prognosis_page_size=1000, prognosis_as_columns=False,
+         prognosis_cache_path=None, prognosis_cache_max_mb=256):
+    global _query_url, _query_headers, _query_session, _logger, _dp_cache_ttl, _prognosis_id_ttl
+    global _bulk_readings_endpoint, _upload_chunk_size, _upload_concurrency
+    global _prognosis_page_size, _prognosis_as_columns, _prognosis_cache
     _query_url = url
     _query_headers = headers
+    _query_session = get_session(url, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
     _logger = logger
+    _dp_cache_ttl = cache_ttl
+    _prognosis_id_ttl = prognosis_id_ttl
+    _bulk_readings_endpoint = bulk_readings_endpoint
+    _upload_chunk_size = upload_chunk_size
+    _upload_concurrency = upload_concurrency
+    _prognosis_page_size = prognosis_page_size
+    _prognosis_as_columns = prognosis_as_columns
+    _prognosis_cache = PrognosisCache(prognosis_cache_path, prognosis_cache_max_mb * 2**20) if prognosis_cache_path else None
+    clear_datapoint_cache()
     
     logger.debug(f"query_utils initialized with URL: {_query_url}")
     
 # Helper to create Query object
 def Q():
-    return Query(_query_url, headers=_query_headers, logger=_logger)
+    return Query(_query_url, headers=_query_headers, logger=_logger, session=_query_session)
+
+###########################################################
+# DATAPOINT CACHE
+###########################################################
+
+def clear_datapoint_cache():
+    with _dp_cache_lock:
+        _dp_cache.clear()
+
+def _evict_expired(now):
+    expired = [k for k, e in _dp_cache.items() if now - e["loaded"] > _dp_cache_ttl]
+    for k in expired:
+        del _dp_cache[k]
+
+def _cache_datapoint(dp, now):
+    _dp_cache[dp["identifier"]] = {"data": dp, "loaded": now, "prognosis_loaded": now}
+
+# Resolve many identifiers with one paginated identifier.in query
+def preload_datapoints(dp_identifiers, page_size=100):
+    identifiers = sorted({i for i in dp_identifiers if i})
+    if not identifiers:
+        return {}
+
+    found = []
+    page = 0
+    while True:
+        dp_page = (
+            Q()
+            .filter(identifier__in=",".join(identifiers))
+            .paginate(page=page, size=page_size)
+            .get("/datapoints")
+        )
+        if dp_page is None:
+            _logger.warning("Bulk datapoint query failed, falling back to per-identifier lookups.")
+            return {}
+        found.extend(dp_page)
+        if len(dp_page) < page_size:
+            break
+        page += 1
+
+    now = time.monotonic()
+    with _dp_cache_lock:
+        _evict_expired(now)
+        for dp in found:
+            _cache_datapoint(dp, now)
+
+    missing = set(identifiers) - {dp["identifier"] for dp in found}
+    if missing:
+        _logger.warning("Datapoints not found: %s", ", ".join(sorted(missing)))
+    _logger.debug("Preloaded %d datapoints in %d page(s)", len(found), page + 1)
+    return {dp["identifier"]: dp for dp in found}
+
+def _cached_datapoint(dp_identifier, refresh_prognosis_id=False):
+    now = time.monotonic()
+    with _dp_cache_lock:
+        _evict_expired(now)
+        entry = _dp_cache.get(dp_identifier)
+        if entry is None:
+            return None
+        if refresh_prognosis_id and now - entry["prognosis_loaded"] > _prognosis_id_ttl:
+            return None
+        return entry["data"]
+
+# Remember a newly posted prognosis id so the next read does not need a refresh
+def _set_cached_prognosis_id(dp_id, prognosis_id):
+    now = time.monotonic()
+    with _dp_cache_lock:
+        for entry in _dp_cache.values():
+            if entry["data"].get("id") == dp_id:
+                entry["data"] = {**entry["data"], "lastPrognosisId": prognosis_id}
+                entry["prognosis_loaded"] = now
     
 ###########################################################
 # GET
 ###########################################################
 
-# GET datapoint data
-def get_datapoint(dp_identifier):
+# GET datapoint data (served from cache when possible)
+def get_datapoint(dp_identifier, refresh_prognosis_id=False):
+    cached = _cached_datapoint(dp_identifier, refresh_prognosis_id)
+    if cached is not None:
+        return [cached]
+
     dp_data = (
         Q()
         .filter(identifier__equals=dp_identifier)
@@ -29,16 +145,14 @@ def get_datapoint(dp_identifier):
         .get("/datapoints")
     )
     _logger.debug("get_datapoint(%s) -> %s", dp_identifier, dp_data)
+    if dp_data:
+        with _dp_cache_lock:
+            _cache_datapoint(dp_data[0], time.monotonic())
     return dp_data
 
 # GET datapoint ID
 def get_datapoint_ID(dp_identifier):
-    dp_data = (
-        Q()
-        .filter(identifier__equals=dp_identifier)
-        .paginate(page=0, size=1)
-        .get("/datapoints")
-    )
+    dp_data = get_datapoint(dp_identifier)
     return dp_data[0]["id"]
 
 # Get datapoint last reading by identifier
@@ -90,28 +204,210 @@ def get_last_control_value_and_status(dp_identifier):
         "sent" : last_reading_value[0].get("sent")}
 
 # GET datapoint last prognosis readings data
-def get_last_prognosis_readings(dp_identifier, generate_if_missing=False):
-    last_prognosis_id = get_datapoint(dp_identifier)[0].get("lastPrognosisId")
+def get_last_prognosis_readings(dp_identifier, generate_if_missing=False, as_columns=None):
+    as_columns = _prognosis_as_columns if as_columns is None else as_columns
+    last_prognosis_id = get_datapoint(dp_identifier, refresh_prognosis_id=True)[0].get("lastPrognosisId")
+    last_prognosis_readings = None
     if last_prognosis_id is not None:
-        last_prognosis_readings = (
-            Q()
-            .filter(datapointPrognosisId__equals=last_prognosis_id)
-            .get("/prognosis-readings")
-        )
-        if not last_prognosis_readings:
-            raise RuntimeError(f"No prognosis readings found for lastPrognosisId={last_prognosis_id}")
-    else:              
-        _logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
+        last_prognosis_readings = _load_prognosis_readings(last_prognosis_id, as_columns)
+        if not len(last_prognosis_readings["id"] if as_columns else last_prognosis_readings):
+            # e.g. a posted plan whose readings failed to upload; a generated one replaces it
+            if not generate_if_missing:
+                raise RuntimeError(f"No prognosis readings found for lastPrognosisId={last_prognosis_id}")
+            _logger.warning(f"Prognosis {last_prognosis_id} of datapoint {dp_identifier} has no readings.")
+            last_prognosis_readings = None
+    if last_prognosis_readings is None:
+        if last_prognosis_id is None:
+            _logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
         if generate_if_missing:
             last_prognosis_readings = Util.generate_prognosis_entries() 
         else:
             last_prognosis_readings = []
+        if as_columns:
+            buffer = ReadingColumns()
+            buffer.extend(last_prognosis_readings)
+            last_prognosis_readings = buffer.columns()
     
     return last_prognosis_readings    
+
+def _load_prognosis_readings(prognosis_id, as_columns):
+    # A posted prognosis never changes, so an unchanged id is served from the disk cache
+    if _prognosis_cache is None:
+        return read_prognosis_readings(prognosis_id, as_columns=as_columns)
+    try:
+        columns = _prognosis_cache.get(prognosis_id)
+    except sqlite3.Error as e:
+        _logger.warning(f"Prognosis cache read failed: {e}")
+        columns = None
+    if columns is None:
+        columns = read_prognosis_readings(prognosis_id, as_columns=True)
+        if len(columns["id"]):
+            try:
+                _prognosis_cache.put(prognosis_id, columns)
+            except sqlite3.Error as e:
+                _logger.warning(f"Prognosis cache write failed: {e}")
+    else:
+        _logger.debug("Prognosis %s served from cache", prognosis_id)
+    return columns if as_columns else columns_to_records(columns)
+
+##########################################################
+# PROGNOSIS READINGS DISK CACHE
+##########################################################
+
+class PrognosisCache:
+    """
+    SQLite store of prognosis reading columns keyed by prognosis id.
+
+    WAL journaling lets several processes share one file; each thread and
+    process uses its own connection. Least recently used prognoses are
+    evicted once the stored columns exceed max_bytes.
+    """
+
+    COLUMNS = (("id", "int64"), ("time", "datetime64[ns]"), ("value", "float64"), ("datapointPrognosisId", "int64"))
+
+    def __init__(self, path, max_bytes=256 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        db = self._connect()
+        with db:
+            db.execute("""CREATE TABLE IF NOT EXISTS prognosis_readings (
+                prognosis_id INTEGER PRIMARY KEY, n INTEGER, ids BLOB, times BLOB, vals BLOB, dp_ids BLOB,
+                size INTEGER, last_used REAL)""")
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():   # connections must not be shared across fork
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get(self, prognosis_id):
+        db = self._connect()
+        with db:
+            row = db.execute("SELECT ids, times, vals, dp_ids FROM prognosis_readings WHERE prognosis_id = ?",
+                             (prognosis_id,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE prognosis_readings SET last_used = ? WHERE prognosis_id = ?", (time.time(), prognosis_id))
+        return {name: np.frombuffer(blob, dtype=dtype).copy() for (name, dtype), blob in zip(self.COLUMNS, row)}
+
+    def put(self, prognosis_id, columns):
+        blobs = [np.ascontiguousarray(columns[name], dtype=dtype).tobytes() for name, dtype in self.COLUMNS]
+        db = self._connect()
+        with db:
+            db.execute("INSERT OR REPLACE INTO prognosis_readings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (prognosis_id, len(columns["id"]), *blobs, sum(map(len, blobs)), time.time()))
+            # Evict least recently used entries beyond the size bound
+            db.execute("""DELETE FROM prognosis_readings WHERE prognosis_id IN (
+                SELECT prognosis_id FROM (
+                    SELECT prognosis_id, SUM(size) OVER (ORDER BY last_used DESC, prognosis_id DESC) AS used
+                    FROM prognosis_readings)
+                WHERE used > ?)""", (self.max_bytes,))
+
+    def clear(self):
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM prognosis_readings")
+
+##########################################################
+# PAGINATED PROGNOSIS READINGS
+##########################################################
+
+class ReadingColumns:
+    "Growable columnar buffer of prognosis readings (epoch ns times, float64 values)"
+
+    FIELDS = (("id", "int64"), ("time", "int64"), ("value", "float64"), ("datapointPrognosisId", "int64"))
+
+    def __init__(self, capacity=0):
+        self._size = 0
+        self._data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.FIELDS}
+
+    def __len__(self):
+        return self._size
+
+    def reserve(self, capacity):
+        if capacity > len(self._data["id"]):
+            for name, column in self._data.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                self._data[name] = grown
+
+    def extend(self, records):
+        n = len(records)
+        end = self._size + n
+        if end > len(self._data["id"]):
+            self.reserve(max(end, 2 * len(self._data["id"])))
+        d = self._data
+        d["id"][self._size:end] = [r.get("id") or 0 for r in records]
+        d["time"][self._size:end] = Util.to_epoch_ns(r["time"] for r in records)
+        d["value"][self._size:end] = [r["value"] for r in records]
+        d["datapointPrognosisId"][self._size:end] = [r.get("datapointPrognosisId") or 0 for r in records]
+        self._size = end
+
+    def columns(self):
+        "Dict of column arrays accepted by pd.DataFrame like the list of reading dicts; times are UTC datetime64[ns]"
+        cols = {name: (column if len(column) == self._size else column[:self._size].copy())
+                for name, column in self._data.items()}
+        cols["time"] = cols["time"].view("datetime64[ns]")
+        return cols
+
+def columns_to_records(columns):
+    "Reading dicts in the API format from ReadingColumns.columns() output"
+    times = np.char.add(np.datetime_as_string(columns["time"], unit="s"), "Z")
+    return [{"id": i, "time": t, "value": v, "datapointPrognosisId": p}
+            for i, t, v, p in zip(columns["id"].tolist(), times.tolist(), columns["value"].tolist(),
+                                  columns["datapointPrognosisId"].tolist())]
+
+def _get_prognosis_page(prognosis_id, page, page_size):
+    return (
+        Q()
+        .filter(datapointPrognosisId__equals=prognosis_id)
+        .order_by("time")
+        .paginate(page=page, size=page_size)
+        .get_page("/prognosis-readings")
+    )
+
+def iter_prognosis_pages(prognosis_id, page_size=None):
+    """Yield (records, total count) per page in time order; the next page is fetched while the caller handles the current one.
+
+    The server may cap the page size, so with a total count paging continues
+    until the received count reaches it. Without one, a page that is not full
+    is the last.
+    """
+    page_size = page_size or _prognosis_page_size
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") as pool:
+        page = 0
+        received = 0
+        pending = pool.submit(_get_prognosis_page, prognosis_id, page, page_size)
+        while pending is not None:
+            records, total = pending.result()
+            if records is None:
+                raise RuntimeError(f"Fetching page {page} of prognosis readings failed for prognosis {prognosis_id}")
+            received += len(records)
+            more = len(records) > 0 and (received < total if total is not None else len(records) == page_size)
+            pending = pool.submit(_get_prognosis_page, prognosis_id, page + 1, page_size) if more else None
+            yield records, total
+            page += 1
+
+def read_prognosis_readings(prognosis_id, page_size=None, as_columns=False, check_total=True):
+    "All readings of a prognosis as a list of dicts or, with as_columns, a dict of numpy columns"
+    buffer = ReadingColumns() if as_columns else []
+    total = None
+    for records, total in iter_prognosis_pages(prognosis_id, page_size):
+        if as_columns and total is not None:
+            buffer.reserve(total)
+        buffer.extend(records)
+    # Detect truncation instead of silently scheduling on a partial prognosis
+    if check_total and total is not None and len(buffer) != total:
+        raise RuntimeError(f"Prognosis {prognosis_id} readings incomplete: received {len(buffer)} of {total}")
+    return buffer.columns() if as_columns else buffer
         
 # GET datapoint's last datapoint prognosis
 def get_datapoint_prognosis(dp_identifier):
-    last_prognosis_id = get_datapoint(dp_identifier)[0].get("lastPrognosisId")
+    last_prognosis_id = get_datapoint(dp_identifier, refresh_prognosis_id=True)[0].get("lastPrognosisId")
     _logger.debug("lastPrognosisId = %s", last_prognosis_id)
     if last_prognosis_id is not None:
         datapoint_prognosis = (
@@ -125,23 +421,145 @@ def get_datapoint_prognosis(dp_identifier):
         _logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
         return None
         
+##########################################################
+# CONCURRENT INPUT FETCH
+##########################################################
+
+class InputSpec(NamedTuple):
+    kind: str                          # "prognosis" or "reading_value"
+    dp_identifier: str
+    required: bool = True
+    generate_if_missing: bool = False
+
+@dataclass
+class ScheduleInputs:
+    lastProductionPrognosis: List[Dict[str, Any]]
+    lastConsumptionPrognosis: List[Dict[str, Any]]
+    lastNpSpotPricePrognosis: List[Dict[str, Any]]
+    npSpotCurrentPrice: float
+    lastEss_e_lt: List[Dict[str, Any]]
+    ess_p: float
+    ess_charge: float
+    ess_charge_end: float
+    ess_soc: float
+    ess_max_p: float
+    ess_max_e: float
+    ess_safe_min: float
+    pccImportLimitW: float
+    pccExportLimitW: float
+
+# Build the fetch spec for generate_schedule from config params
+def schedule_input_spec(params):
+    return {
+        "lastProductionPrognosis": InputSpec("prognosis", params['production_p_lt_DP_ID']),
+        "lastConsumptionPrognosis": InputSpec("prognosis", params['consumption_p_lt_DP_ID']),
+        "lastNpSpotPricePrognosis": InputSpec("prognosis", params['elering_nps_price_DP_ID']),
+        "npSpotCurrentPrice": InputSpec("reading_value", params['elering_nps_price_DP_ID']),
+        "lastEss_e_lt": InputSpec("prognosis", params['ess_e_lt_DP_ID'], generate_if_missing=True),
+        "ess_p": InputSpec("reading_value", params['ess_p_DP_ID']),
+        "ess_charge": InputSpec("reading_value", params['ess_charge_DP_ID']),
+        "ess_charge_end": InputSpec("reading_value", params['ess_charge_end_DP_ID']),
+        "ess_soc": InputSpec("reading_value", params['ess_avg_SOC_DP_ID']),
+        "ess_max_p": InputSpec("reading_value", params['ess_max_p_DP_ID']),
+        "ess_max_e": InputSpec("reading_value", params['ess_max_e_DP_ID']),
+        "ess_safe_min": InputSpec("reading_value", params['ess_min_batt_safe_lim_DP_ID']),
+        "pccImportLimitW": InputSpec("reading_value", params['pccImportLimitW_DP_ID']),
+        "pccExportLimitW": InputSpec("reading_value", params['pccExportLimitW_DP_ID']),
+    }
+
+def _fetch_input(spec):
+    if spec.kind == "prognosis":
+        return get_last_prognosis_readings(spec.dp_identifier, generate_if_missing=spec.generate_if_missing)
+    if spec.kind == "reading_value":
+        return get_last_reading_value(spec.dp_identifier)
+    raise ValueError(f"Unknown input kind: {spec.kind}")
+
+# Run all lookups of the spec in parallel; fail fast when a required input fails
+def fetch_inputs(spec, max_workers=8, bundle=ScheduleInputs):
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+    try:
+        futures = {pool.submit(_fetch_input, s): name for name, s in spec.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                if spec[name].required:
+                    raise RuntimeError(f"Failed to fetch input {name} ({spec[name].dp_identifier}): {e}") from e
+                _logger.warning(f"Optional input {name} ({spec[name].dp_identifier}) unavailable: {e}")
+                results[name] = None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return bundle(**results) if bundle is not None else results
+
 ##########################################################        
 # POST
 ##########################################################
-# POST prognosis readings
-def post_prognosis_readings(prognosis_readings_payload):
-    for reading in prognosis_readings_payload:
-        response = (Q().post("/prognosis-readings", json=reading))
-    return response
+class ChunkResult(NamedTuple):
+    index: int                         # chunk position in the plan
+    readings: List[Dict[str, Any]]
+    failed: List[Dict[str, Any]]       # readings that were not stored
+    responses: List[Any]
+
+    @property
+    def ok(self):
+        return not self.failed
+
+def _post_readings_chunk(index, chunk):
+    if _bulk_readings_endpoint:
+        response = Q().post(_bulk_readings_endpoint, json=chunk)
+        return ChunkResult(index, chunk, [] if response is not None else chunk, [response])
+
+    responses = [Q().post("/prognosis-readings", json=reading) for reading in chunk]
+    failed = [reading for reading, response in zip(chunk, responses) if response is None]
+    return ChunkResult(index, chunk, failed, responses)
+
+# Prognosis readings payload from arrays; times are naive UTC datetime64 values
+def encode_prognosis_readings(times_utc, values):
+    times = np.char.add(np.datetime_as_string(np.asarray(times_utc, dtype="datetime64[s]"), unit="s"), "Z")
+    return [{"time": t, "value": v} for t, v in zip(times.tolist(), np.asarray(values, dtype="float64").tolist())]
+
+# POST prognosis readings in chunks with bounded parallelism; returns one ChunkResult per chunk
+def post_prognosis_readings(prognosis_readings_payload, chunk_size=None, max_workers=None):
+    chunk_size = chunk_size or _upload_chunk_size
+    max_workers = max_workers or _upload_concurrency
+    chunks = [prognosis_readings_payload[i:i + chunk_size]
+              for i in range(0, len(prognosis_readings_payload), chunk_size)]
+    if not chunks:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix="upload") as pool:
+        results = list(pool.map(_post_readings_chunk, range(len(chunks)), chunks))
+
+    failed = sum(len(r.failed) for r in results)
+    if failed:
+        _logger.warning(f"{failed} of {len(prognosis_readings_payload)} prognosis readings failed to upload "
+                        f"({sum(not r.ok for r in results)} of {len(results)} chunks)")
+    return results
+
+# Re-POST only the failed readings of a previous upload
+def retry_failed_readings(results, chunk_size=None, max_workers=None):
+    failed = [reading for r in results for reading in r.failed]
+    if not failed:
+        return []
+    return post_prognosis_readings(failed, chunk_size=chunk_size, max_workers=max_workers)
 
-# POST datapoint prognosis
+# POST datapoint prognosis; raises when the prognosis or some of its readings were not stored
 def post_datapoint_prognosis(prognosis_payload):
     response = (Q().post("/datapoint-prognoses", json=prognosis_payload))
+    if not response or "id" not in response:
+        raise RuntimeError(f"Posting prognosis for datapoint {prognosis_payload['datapointId']} failed")
+    _set_cached_prognosis_id(prognosis_payload["datapointId"], response["id"])
     
-    prognosis_readings_payload = prognosis_payload["readings"]
-    for dp_pr_id in prognosis_readings_payload:
-        dp_pr_id["datapointPrognosisId"] = response["id"]
-    post_prognosis_readings(prognosis_readings_payload)
+    prognosis_readings_payload = [{**reading, "datapointPrognosisId": response["id"]} for reading in prognosis_payload["readings"]]
+    results = post_prognosis_readings(prognosis_readings_payload)
+    if any(not r.ok for r in results):
+        results = retry_failed_readings(results)
+        if any(not r.ok for r in results):
+            failed = sum(len(r.failed) for r in results)
+            raise RuntimeError(f"Prognosis {response['id']} stored with {failed} of {len(prognosis_readings_payload)} readings missing after retry")
     
     return response
 
@@ -0,0 +1,197 @@
+### Scenario evaluation of ESS plans ###
+# Evaluates a fixed ESS plan against many perturbed forecasts in one pass.
+# The battery follows the plan and the grid absorbs every deviation, so
+# costs use the import/export/tariff/degradation terms of the model objective.
+import argparse
+import logging
+import time
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+import benchmark
+import ess_scheduling
+
+class PlanEvaluation(NamedTuple):
+    # One value per scenario
+    import_cost: np.ndarray          # EUR, spot + tariff
+    export_revenue: np.ndarray       # EUR, spot
+    degradation_cost: np.ndarray     # EUR
+    import_excess_kWh: np.ndarray    # energy imported above the PCC import limit
+    export_excess_kWh: np.ndarray    # energy exported beyond the PCC export limit
+    pcc_violation_periods: np.ndarray
+    soc_below_min: np.ndarray        # largest SoC shortfall under the lower bound, %
+    soc_above_max: np.ndarray        # largest SoC excess over the upper bound, %
+    soc_end_error: np.ndarray        # end SoC minus the soc_end target, %
+
+    @property
+    def cost(self):
+        return self.import_cost - self.export_revenue + self.degradation_cost
+
+    @property
+    def violated(self):
+        return (self.pcc_violation_periods > 0) | (self.soc_below_min > 0) | (self.soc_above_max > 0)
+
+def _rows(values, base):
+    "Scenario array (S, T), or the point forecast as a single row"
+    return np.atleast_2d(np.asarray(base if values is None else values, dtype='float64'))
+
+def _row_dot(a, b):
+    # Matrix-vector product when b is shared by all scenarios
+    return a @ b[0] if b.shape[0] == 1 else np.einsum('st,st->s', a, b)
+
+def evaluate_plan(plan, model_inputs, load=None, pv=None, spot=None, soc_0=None, soc_min=0.0, soc_max=100.0, tol=1e-6):
+    """Cost breakdown and constraint violations of an ESS plan (W per period) for every scenario.
+
+    load, pv and spot are (S, T) arrays in the units of model_inputs; a missing
+    one is the point forecast for all scenarios. soc_0 may be a scalar or (S,).
+    """
+    ess = np.asarray(plan, dtype='float64')
+    load, pv, spot = _rows(load, model_inputs["load"]), _rows(pv, model_inputs["pv"]), _rows(spot, model_inputs["spot"])
+    S = max(len(load), len(pv), len(spot), np.size(soc_0) if soc_0 is not None else 1)
+    kWh = model_inputs["kW_to_kWh"] / 1000
+    tariff = np.asarray(model_inputs["tariff"], dtype='float64')
+
+    # PCC power per scenario and period
+    pcc = load + pv
+    pcc += ess
+    pcc_import = np.maximum(pcc, 0)
+    pcc_export = np.negative(pcc, out=pcc)
+    np.maximum(pcc_export, 0, out=pcc_export)
+
+    import_cost = _row_dot(pcc_import, spot / 1000 + tariff) * kWh
+    export_revenue = _row_dot(pcc_export, spot / 1000) * kWh
+    degradation_cost = np.full(S, np.maximum(ess, 0).sum() * kWh * model_inputs["deg_cost"])
+
+    # PCC limits; the export limit is negative
+    import_excess = np.maximum(pcc_import - model_inputs["imp_lim_kW"], 0)
+    export_excess = np.maximum(pcc_export + model_inputs["exp_lim_kW"], 0)
+    violation_periods = np.count_nonzero((import_excess > tol) | (export_excess > tol), axis=1)
+
+    # SoC at the start of every period and at the end of the horizon
+    gain = model_inputs["kW_to_kWh"] / model_inputs["ess_eff_kWh"] * 100
+    path = gain * np.concatenate(([0.0], np.cumsum(ess)))
+    start = np.asarray(model_inputs["soc_0"] if soc_0 is None else soc_0, dtype='float64').reshape(-1)
+    low, high = start + path.min(), start + path.max()
+    below = np.maximum(soc_min - low, 0)
+    above = np.maximum(high - soc_max, 0)
+    soc_end = model_inputs.get("soc_end")
+    end_error = start + path[-1] - soc_end if soc_end is not None else np.zeros_like(start)
+
+    return PlanEvaluation(
+        import_cost=np.broadcast_to(import_cost, S),
+        export_revenue=np.broadcast_to(export_revenue, S),
+        degradation_cost=degradation_cost,
+        import_excess_kWh=np.broadcast_to(import_excess.sum(axis=1) * kWh, S),
+        export_excess_kWh=np.broadcast_to(export_excess.sum(axis=1) * kWh, S),
+        pcc_violation_periods=np.broadcast_to(violation_periods, S),
+        soc_below_min=np.broadcast_to(np.where(below > tol, below, 0), S),
+        soc_above_max=np.broadcast_to(np.where(above > tol, above, 0), S),
+        soc_end_error=np.broadcast_to(end_error, S),
+    )
+
+def summarise(evaluation, alpha=0.95):
+    "Expected cost, cost quantile, CVaR (mean of the worst 1 - alpha) and violation statistics"
+    cost = evaluation.cost
+    quantile = float(np.quantile(cost, alpha))
+    return {
+        "expected_cost": float(cost.mean()),
+        "cost_quantile": quantile,
+        "cvar": float(cost[cost >= quantile].mean()),
+        "violation_rate": float(evaluation.violated.mean()),
+        "expected_import_excess_kWh": float(evaluation.import_excess_kWh.mean()),
+        "expected_export_excess_kWh": float(evaluation.export_excess_kWh.mean()),
+        "max_soc_violation": float(max(evaluation.soc_below_min.max(), evaluation.soc_above_max.max())),
+    }
+
+def choose_plan(plans, model_inputs, alpha=0.95, max_violation_rate=0.0, **scenarios):
+    """Index of the most robust plan and the summaries of all plans.
+
+    Among plans violating limits in at most max_violation_rate of the scenarios
+    the lowest CVaR wins; when none qualifies, the fewest violations win.
+    """
+    summaries = [summarise(evaluate_plan(plan, model_inputs, **scenarios), alpha) for plan in plans]
+
+    def rank(i):
+        rate = summaries[i]["violation_rate"]
+        return (rate > max_violation_rate, rate if rate > max_violation_rate else 0.0, summaries[i]["cvar"])
+
+    return min(range(len(plans)), key=rank), summaries
+
+########################### Scenario generation #################################
+def correlated_noise(n, T, rho, rng):
+    "Standard normal AR(1) noise of shape (n, T), stationary from the first period"
+    eps = rng.standard_normal((n, T))
+    zi = rho * rng.standard_normal((n, 1))
+    return lfilter([np.sqrt(1 - rho**2)], [1, -rho], eps, axis=1, zi=zi)[0]
+
+def perturb_forecasts(model_inputs, n, load_sigma=0.15, pv_sigma=0.25, spot_sigma=20.0, rho=0.9, seed=None):
+    """n scenarios of load, pv and spot around the point forecast.
+
+    Load and PV get relative errors (sigma as a fraction) that never flip their
+    sign, spot gets absolute errors in EUR/MWh. Errors are autocorrelated in time.
+    """
+    rng = np.random.default_rng(seed)
+    T = len(model_inputs["load"])
+    scenarios = {}
+    for name, sigma in (("load", load_sigma), ("pv", pv_sigma)):
+        factor = 1 + sigma * correlated_noise(n, T, rho, rng)
+        scenarios[name] = np.asarray(model_inputs[name], dtype='float64') * np.maximum(factor, 0, out=factor)
+    scenarios["spot"] = np.asarray(model_inputs["spot"], dtype='float64') + spot_sigma * correlated_noise(n, T, rho, rng)
+    return scenarios
+
+########################### Candidate comparison #################################
+def synthetic_model_inputs(horizon_h, interval_min, seed=0):
+    "Model inputs for a synthetic site with the benchmark's prognoses"
+    production, consumption, price = benchmark.synthetic_prognoses(horizon_h, interval_min, seed)
+    # Same day/night/weekend tariff as the scheduler
+    index = pd.to_datetime([r['time'] for r in price], utc=True)
+    return dict(
+        load=np.array([r['value'] for r in consumption[1:]]), pv=np.array([r['value'] for r in production[1:]]),
+        spot=np.array([r['value'] for r in price]), tariff=ess_scheduling.grid_tariff(index, 0.07, 0.05),
+        ess_kW=5000, imp_lim_kW=20000, exp_lim_kW=-15000, kW_to_kWh=interval_min / 60, ess_eff_kWh=10000,
+        soc_0=50.0, soc_end=50.0, deg_cost=0.139)
+
+def candidate_plans(model_inputs, logger, solver="glpk", model_backend="matrix"):
+    "ESS plans optimised for the point forecast and for pessimistic and optimistic load/PV, plus an idle battery"
+    variants = {
+        "point": {},
+        "high_load_low_pv": {"load": model_inputs["load"] * 1.2, "pv": model_inputs["pv"] * 0.8},
+        "low_load_high_pv": {"load": model_inputs["load"] * 0.8, "pv": model_inputs["pv"] * 1.2},
+    }
+    plans = {}
+    for name, changes in variants.items():
+        solution = ess_scheduling.solve_model({**model_inputs, **changes}, logger, model_backend, solver=solver)
+        if solution is not None:
+            plans[name] = solution["ESS_kW"]
+    plans["idle"] = np.zeros(len(model_inputs["load"]))
+    return plans
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare candidate ESS plans under perturbed forecasts")
+    parser.add_argument("--hours", type=int, default=24, help="Horizon in hours")
+    parser.add_argument("--interval", type=int, default=15, help="Interval in minutes")
+    parser.add_argument("-n", "--scenarios", type=int, default=5000, help="Number of scenarios")
+    parser.add_argument("--alpha", type=float, default=0.95, help="CVaR level")
+    parser.add_argument("--solver", default="glpk")
+    parser.add_argument("--backend", default="matrix", help="Model backend for the candidate plans")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("scenarios")
+    logger.setLevel(logging.WARNING)
+
+    model_inputs = synthetic_model_inputs(args.hours, args.interval, args.seed)
+    plans = candidate_plans(model_inputs, logger, args.solver, args.backend)
+    started = time.perf_counter()
+    scenarios = perturb_forecasts(model_inputs, args.scenarios, seed=args.seed)
+    best, summaries = choose_plan(list(plans.values()), model_inputs, args.alpha, **scenarios)
+    elapsed = time.perf_counter() - started
+
+    for (name, _), summary in zip(plans.items(), summaries):
+        print(f"{'*' if name == list(plans)[best] else ' '} {name:>17}: expected {summary['expected_cost']:.3f} EUR, "
+              f"CVaR{args.alpha:.0%} {summary['cvar']:.3f} EUR, violations {summary['violation_rate']:.1%}")
+    print(f"{len(plans)} plans x {args.scenarios} scenarios x {len(model_inputs['load'])} periods evaluated in {elapsed:.2f} s")
+
+if __name__ == "__main__":
+    main()
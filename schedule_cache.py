@@ -0,0 +1,120 @@
+### Input fingerprint cache for generate_schedule ###
+# A solved plan stays optimal for the rest of its horizon as long as the
+# inputs over those periods have not changed and the battery followed the
+# plan, so it can be reused shifted to the new start instead of re-solving.
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# Quantisation step per input; differences below the step do not count as a change
+DEFAULT_TOLERANCES = {
+    "power": 50.0,          # W, load and PV prognoses
+    "spot": 0.5,            # €/MWh
+    "tariff": 1e-4,         # €/kWh
+    "limit": 100.0,         # W, ESS and PCC power limits
+    "energy": 10.0,         # Wh, ESS capacity
+    "soc": 1.0,             # %, start SoC against the planned SoC and end SoC target
+    "deg_cost": 1e-4,       # €/kWh
+}
+
+ARRAYS = {"load": "power", "pv": "power", "spot": "spot", "tariff": "tariff"}
+SCALARS = {"ess_kW": "limit", "imp_lim_kW": "limit", "exp_lim_kW": "limit", "ess_eff_kWh": "energy",
+           "soc_end": "soc", "deg_cost": "deg_cost"}
+
+def epoch_ns(index):
+    "UTC epoch nanoseconds of a tz-aware DatetimeIndex"
+    return np.asarray(index.tz_convert("UTC").tz_localize(None), dtype="datetime64[ns]").view("int64")
+
+def _quantise(value, step):
+    return np.round(np.asarray(value, dtype="float64") / step).astype("int64")
+
+def fingerprint(model_inputs, tolerances, start=0):
+    "Hash of the quantised inputs from period `start` on; soc_0 is checked against the plan separately"
+    h = hashlib.sha256()
+    h.update(np.float64(model_inputs["kW_to_kWh"]).tobytes())
+    for name, kind in ARRAYS.items():
+        h.update(_quantise(model_inputs[name][start:], tolerances[kind]).tobytes())
+    for name, kind in SCALARS.items():
+        value = model_inputs[name]
+        h.update(b"none" if value is None else _quantise(value, tolerances[kind]).tobytes())
+    return h.hexdigest()
+
+class ScheduleCache:
+    "Last solved plan of one site, optionally persisted to an .npz file between runs"
+
+    def __init__(self, path=None, tolerances=None):
+        self.path = path
+        self.tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+        self.hits = 0
+        self.misses = 0
+        self._entry = self._load() if path else None
+
+    def lookup(self, index, model_inputs):
+        "Stored ESS plan for the periods of index, or None when anything material changed"
+        plan = self._match(epoch_ns(index), model_inputs)
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return plan
+
+    def _match(self, times, model_inputs):
+        entry = self._entry
+        if entry is None or len(times) == 0:
+            return None
+        # The new periods must be the tail of the stored horizon, on the same grid and with the same end
+        k = int(np.searchsorted(entry["times"], times[0]))
+        if len(entry["times"]) - k != len(times) or not np.array_equal(entry["times"][k:], times):
+            return None
+        # The battery must be where the plan expected it to be
+        if abs(model_inputs["soc_0"] - entry["soc"][k]) > self.tolerances["soc"]:
+            return None
+        if fingerprint(entry["inputs"], self.tolerances, k) != fingerprint(model_inputs, self.tolerances):
+            return None
+        return entry["ess"][k:].copy()
+
+    def store(self, index, model_inputs, solution):
+        self._entry = {
+            "times": epoch_ns(index),
+            "ess": np.asarray(solution["ESS_kW"], dtype="float64").copy(),
+            "soc": np.asarray(solution["ESS_SoC"], dtype="float64").copy(),
+            "inputs": {name: (np.asarray(model_inputs[name], dtype="float64").copy() if name in ARRAYS else model_inputs[name])
+                       for name in ("kW_to_kWh", *ARRAYS, *SCALARS)},
+        }
+        if self.path:
+            self._save()
+
+    def update(self, other):
+        "Take over the plan and counters of a copy used in another process"
+        self._entry, self.hits, self.misses = other._entry, other.hits, other.misses
+
+    def clear(self):
+        self._entry = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        entry = self._entry
+        inputs = {f"input_{k}": np.asarray(np.nan if v is None else v, dtype="float64") for k, v in entry["inputs"].items()}
+        # Write atomically so a concurrent run never reads a partial file
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, times=entry["times"], ess=entry["ess"], soc=entry["soc"], **inputs)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                inputs = {}
+                for k in ("kW_to_kWh", *ARRAYS, *SCALARS):
+                    value = data[f"input_{k}"]
+                    inputs[k] = value if k in ARRAYS else (None if np.isnan(value) else float(value))
+                return {"times": data["times"], "ess": data["ess"], "soc": data["soc"], "inputs": inputs}
+        except (OSError, KeyError, ValueError):
+            return None
+
+def cached_schedule(index, plan):
+    "generate_schedule result frame for a reused plan"
+    schedule = pd.DataFrame({"datetime": index, "ESS": plan})
+    schedule.attrs.update(cache_hit=True, solve_status="cached", mip_gap=None, mip_bound=None, objective=None)
+    return schedule
@@ -0,0 +1,43 @@
+import logging
+import time
+import pytest
+import yaml
+import batch
+import main
+import ess_scheduling
+import mock_api
+
+logger = logging.getLogger("tests")
+
+@pytest.fixture
+def site_configs(tmp_path):
+    raw_data = {"logLevel": "ERROR", "params": {**mock_api.DEFAULT_PARAMS, "schedule_cache": True}}
+    server = mock_api.start_server(mock_api.Store(mock_api.synthetic_fixture(raw_data["params"], sites=2)))
+    paths = []
+    for site in range(2):
+        path = tmp_path / f"site{site}.yaml"
+        path.write_text(yaml.safe_dump(mock_api.site_config(raw_data, site, 2, server.url)))
+        paths.append(str(path))
+    yield paths
+    server.shutdown()
+
+def test_timeout_status_when_solver_swallows_errors(site_configs, monkeypatch):
+    def slow_schedule(**kwargs):
+        # Solver wrappers catch Exception and report no solution; the timeout must still get through
+        try:
+            time.sleep(5)
+        except Exception:
+            return None
+
+    monkeypatch.setattr(ess_scheduling, "generate_schedule", slow_schedule)
+    results = batch.run_batch(site_configs, logger, workers=1, timeout=0.2)
+    assert {r["status"] for r in results.values()} == {"timeout"}
+
+def test_sites_posted(site_configs):
+    results = batch.run_batch(site_configs, logger, workers=1, timeout=30)
+    assert {r["status"] for r in results.values()} == {"posted"}
+
+def test_worker_schedule_cache_reaches_parent(site_configs):
+    batch.run_batch(site_configs, logger, workers=1, timeout=30)
+    for path in site_configs:
+        assert main.get_schedule_cache(main.load_config(path))._entry is not None
@@ -0,0 +1,32 @@
+import itertools
+import numpy as np
+import pytest
+import ess_dp
+
+def dp_inputs(T):
+    # A large battery with small power keeps the action set at MIN_ACTIONS steps per direction
+    rng = np.random.default_rng(3)
+    return dict(load=rng.uniform(500, 4000, T), pv=-rng.uniform(0, 3000, T), spot=rng.uniform(-20, 200, T),
+                tariff=np.full(T, 0.05), ess_kW=2000, imp_lim_kW=20000, exp_lim_kW=-15000, kW_to_kWh=0.25,
+                ess_eff_kWh=100000, soc_0=50.0, soc_end=50.5, deg_cost=0.01)
+
+def plan_cost(m, plan):
+    costs = ess_dp.period_costs(m["load"], m["pv"], m["spot"], m["tariff"], np.asarray(plan)[:, None],
+                                m["imp_lim_kW"], m["exp_lim_kW"], m["kW_to_kWh"], m["deg_cost"])
+    return costs.sum()
+
+def test_dp_finds_grid_optimum():
+    # The window view is built once per solve and must follow the value updates of every period
+    m = dp_inputs(5)
+    plan = ess_dp.solve_dp(**m)
+    gain = m["kW_to_kWh"] / m["ess_eff_kWh"] * 100
+    actions = np.arange(-ess_dp.MIN_ACTIONS, ess_dp.MIN_ACTIONS + 1) * m["ess_kW"] / ess_dp.MIN_ACTIONS
+
+    # Every grid path of the first periods; the last one steers onto soc_end
+    best = np.inf
+    for path in itertools.product(actions, repeat=len(m["load"]) - 1):
+        last = (m["soc_end"] - m["soc_0"]) / gain - sum(path)
+        if abs(last) <= m["ess_kW"] + 1e-9:
+            best = min(best, plan_cost(m, list(path) + [last]))
+    assert plan is not None
+    assert plan_cost(m, plan) == pytest.approx(best, rel=1e-9)
@@ -0,0 +1,64 @@
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+import benchmark
+import ess_scheduling
+
+logger = logging.getLogger("tests")
+
+def baseline_tariff(dataset, DAY_TARIFF, NIGHT_TARIFF):
+    # The rule generate_schedule applied inline before grid_tariff
+    night = (dataset.index.weekday >= 5) | (dataset.index.hour >= 22) | (dataset.index.hour < 7)
+    return np.where(night, NIGHT_TARIFF, DAY_TARIFF).astype('float64')
+
+def test_grid_tariff_matches_baseline_rule():
+    # Two weeks of 15 min periods, across the spring DST change in Europe
+    index = pd.date_range("2026-03-23", periods=14 * 96, freq="15min", tz="UTC")
+    dataset = pd.DataFrame(index=index)
+    np.testing.assert_array_equal(ess_scheduling.grid_tariff(index, 0.07, 0.05), baseline_tariff(dataset, 0.07, 0.05))
+
+def test_period_diagnostics_logged_at_debug(caplog):
+    arguments = benchmark.synthetic_arguments(24, 60)
+    with caplog.at_level(logging.INFO, logger="tests"):
+        ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp")
+    assert not any("Scheduling results" in m for m in caplog.messages)
+
+    caplog.clear()
+    with caplog.at_level(logging.DEBUG, logger="tests"):
+        ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp")
+    assert any("Scheduling results" in m for m in caplog.messages)
+    assert any(m.startswith("PCC_EXPORT_kW[0]") for m in caplog.messages)
+
+class FrozenClock(datetime):
+    wall = datetime(2026, 1, 5, 3, 10)
+    @classmethod
+    def now(cls, tz=None):
+        return cls.wall
+
+def replay_arguments():
+    arguments = benchmark.synthetic_arguments(24, 60)
+    start = datetime(2026, 1, 5, tzinfo=timezone.utc)
+    production, consumption, price = benchmark.synthetic_prognoses(24, 60, start_time=start)
+    arguments.update(lastProductionPrognosis=production, lastConsumptionPrognosis=consumption,
+                     lastNpSpotPricePrognosis=price, npSpotCurrentPrice=400.0)
+    return arguments
+
+def test_current_price_insert_at_start_time(monkeypatch):
+    # A live run (startTime left to the clock) inserts the current price at the wall-clock hour as before
+    monkeypatch.setattr(ess_scheduling, "datetime", FrozenClock)
+    arguments = replay_arguments()
+    live = ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp")
+
+    # A replay at the same time sees the same prices whatever the wall clock says
+    monkeypatch.setattr(FrozenClock, "wall", datetime(2030, 6, 1, 12, 0))
+    replay = ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp",
+                                              startTime=datetime(2026, 1, 5, 3, 10))
+    pd.testing.assert_frame_equal(live, replay)
+    assert live.attrs["objective"] == replay.attrs["objective"]
+
+    # The 03:00 price was replaced by the current price
+    arguments["npSpotCurrentPrice"] = 80.0
+    prices = ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp",
+                                              startTime=datetime(2026, 1, 5, 3, 10))
+    assert prices.attrs["objective"] != live.attrs["objective"]
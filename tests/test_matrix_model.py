@@ -0,0 +1,66 @@
+import logging
+import numpy as np
+import pytest
+from pyomo.environ import SolverFactory, value
+import ess_matrix_model
+import ess_scheduling
+import scenarios
+
+highspy = pytest.importorskip("highspy")
+
+def model_inputs(soc_end):
+    inputs = scenarios.synthetic_model_inputs(24, 60)
+    inputs["soc_end"] = soc_end
+    if soc_end is None:
+        inputs["soc_end_value"] = ess_scheduling.soc_value(inputs, 0, len(inputs["load"]))
+    return inputs
+
+def solve_pyomo(inputs):
+    opt = SolverFactory("appsi_highs")
+    if not opt.available(exception_flag=False):
+        pytest.skip("appsi_highs is not available")
+    opt.options["mip_rel_gap"] = 0
+    m = ess_scheduling.build_pyomo_model(**inputs)
+    opt.solve(m)
+    return value(m.objective)
+
+def solve_mps(model, path):
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    h.setOptionValue("mip_rel_gap", 0)
+    ess_matrix_model.write_mps(model, str(path))
+    assert h.readModel(str(path)) == highspy.HighsStatus.kOk
+    h.run()
+    assert h.getModelStatus() == highspy.HighsModelStatus.kOptimal
+    return h.getInfo().objective_function_value, np.array(h.getSolution().col_value)
+
+@pytest.mark.parametrize("soc_end", [50.0, None])
+def test_matrix_model_matches_pyomo(soc_end, tmp_path):
+    inputs = model_inputs(soc_end)
+    model = ess_matrix_model.build_matrices(**inputs)
+
+    matrix = ess_matrix_model.solve_highs(model, mip_gap=0)
+    mps_objective, x = solve_mps(model, tmp_path / "model.mps")
+    pyomo_objective = solve_pyomo(inputs)
+
+    assert matrix["status"] == "optimal"
+    assert matrix["objective"] == pytest.approx(pyomo_objective, rel=1e-6, abs=1e-9)
+    assert mps_objective == pytest.approx(pyomo_objective, rel=1e-6, abs=1e-9)
+    # The MPS file holds the same columns as the in-memory matrices
+    mps_solution = ess_matrix_model.unpack_solution(model, x, mps_objective)
+    assert ess_scheduling.solution_cost(inputs, mps_solution) == pytest.approx(
+        ess_scheduling.solution_cost(inputs, matrix), rel=1e-6, abs=1e-9)
+
+def test_highs_uses_warm_start():
+    inputs = model_inputs(50.0)
+    model = ess_matrix_model.build_matrices(**inputs)
+    start = ess_scheduling.solve_dp_model(inputs, logging.getLogger("tests"))
+
+    # Too little time to find an incumbent alone; the start is kept as one
+    warm = ess_matrix_model.solve_highs(model, time_limit=1e-3, initial=start)
+    assert warm is not None
+    assert warm["objective"] <= start["objective"] + 1e-9
+
+    optimal = ess_matrix_model.solve_highs(model, mip_gap=0, initial=start)
+    assert optimal["status"] == "optimal"
+    assert optimal["objective"] == pytest.approx(ess_matrix_model.solve_highs(model, mip_gap=0)["objective"], rel=1e-6)
@@ -0,0 +1,39 @@
+import logging
+import pytest
+import main
+import mock_api
+
+logger = logging.getLogger("tests")
+
+def start_site(profiles=None):
+    raw_data = {"logLevel": "ERROR", "params": {**mock_api.DEFAULT_PARAMS, "schedule_cache": True}}
+    server = mock_api.start_server(mock_api.Store(mock_api.synthetic_fixture(raw_data["params"])), profiles=profiles)
+    raw_data = mock_api.site_config(raw_data, 0, 1, server.url)
+    main.init_query_utils(raw_data, logger)
+    return server, raw_data
+
+def test_failed_reading_upload_clears_schedule_cache():
+    failing = mock_api.EndpointProfile(error_rate=1.0, error_statuses=(500,))
+    server, raw_data = start_site({"POST /prognosis-readings": failing})
+    try:
+        main.schedule_cycle(raw_data, logger)
+        assert main.get_schedule_cache(raw_data)._entry is None
+
+        # With the API back, the next cycle solves and posts instead of reporting a cache hit
+        server.profiles.clear()
+        main.schedule_cycle(raw_data, logger)
+        assert main.get_schedule_cache(raw_data)._entry is not None
+        posted = [r for r in server.requests if r[:2] == ("POST", "/prognosis-readings") and r[2] == 201]
+        assert posted
+    finally:
+        server.shutdown()
+
+def test_failed_prognosis_post_raises():
+    failing = mock_api.EndpointProfile(error_rate=1.0, error_statuses=(500,))
+    server, raw_data = start_site({"POST /datapoint-prognoses": failing})
+    try:
+        import query_utils
+        with pytest.raises(RuntimeError):
+            query_utils.post_datapoint_prognosis({"datapointId": 1, "time": "2026-01-01T00:00:00Z", "readings": []})
+    finally:
+        server.shutdown()
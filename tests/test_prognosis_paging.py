@@ -0,0 +1,50 @@
+import logging
+import pytest
+import mock_api
+import query_utils
+
+logger = logging.getLogger("tests")
+
+@pytest.fixture
+def capped_api():
+    params = dict(mock_api.DEFAULT_PARAMS)
+    server = mock_api.start_server(mock_api.Store(mock_api.synthetic_fixture(params)),
+                                   default_profile=mock_api.EndpointProfile(max_page_size=50))
+    query_utils.init(server.url, {"Authorization": "mock"}, logger, prognosis_page_size=1000)
+    yield server
+    server.shutdown()
+
+def test_pages_until_total_when_server_caps_page_size(capped_api):
+    readings = query_utils.get_last_prognosis_readings(mock_api.DEFAULT_PARAMS["production_p_lt_DP_ID"])
+    assert len(readings) == 145
+    assert [r["time"] for r in readings] == sorted(r["time"] for r in readings)
+    assert len({r["id"] for r in readings}) == 145
+
+def paged_without_total(monkeypatch, records, ignore_paging=False):
+    requested = []
+
+    def get_page(prognosis_id, page, page_size):
+        requested.append(page)
+        if ignore_paging:
+            return records, None
+        return records[page * page_size:(page + 1) * page_size], None   # no X-Total-Count
+
+    monkeypatch.setattr(query_utils, "_get_prognosis_page", get_page)
+    return requested
+
+RECORDS = [{"id": i, "time": f"2026-01-01T00:{i:02d}:00Z", "value": float(i), "datapointPrognosisId": 1} for i in range(25)]
+
+def test_short_page_ends_paging_without_total(monkeypatch):
+    requested = paged_without_total(monkeypatch, RECORDS)
+    assert len(query_utils.read_prognosis_readings(1, page_size=10)) == 25
+    assert requested == [0, 1, 2]
+
+def test_full_last_page_without_total_needs_one_empty_page(monkeypatch):
+    requested = paged_without_total(monkeypatch, RECORDS[:20])
+    assert len(query_utils.read_prognosis_readings(1, page_size=10)) == 20
+    assert requested == [0, 1, 2]
+
+def test_server_ignoring_paging_without_total(monkeypatch):
+    requested = paged_without_total(monkeypatch, RECORDS, ignore_paging=True)
+    assert len(query_utils.read_prognosis_readings(1, page_size=10)) == 25
+    assert requested == [0]
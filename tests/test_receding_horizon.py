@@ -0,0 +1,52 @@
+import logging
+import numpy as np
+import pytest
+import benchmark
+import ess_scheduling
+import scenarios
+
+logger = logging.getLogger("tests")
+
+def dp_solve(inputs, initial, deadline):
+    return ess_scheduling.solve_dp_model(inputs, logger)
+
+@pytest.mark.parametrize("overlap", [0, 8])
+def test_windows_chain_soc(overlap):
+    model_inputs = scenarios.synthetic_model_inputs(72, 15)
+    solution = ess_scheduling.solve_receding_horizon(model_inputs, 48, overlap, dp_solve, logger=logger)
+
+    assert solution is not None
+    T = len(model_inputs["load"])
+    assert len(solution["ESS_kW"]) == T
+    # Every window starts from the SoC the previous one committed to
+    gain = model_inputs["kW_to_kWh"] / model_inputs["ess_eff_kWh"] * 100
+    soc = model_inputs["soc_0"] + gain * np.concatenate(([0.0], np.cumsum(solution["ESS_kW"])))
+    np.testing.assert_allclose(solution["ESS_SoC"], soc[:-1], atol=1e-6)
+    assert soc[-1] == pytest.approx(model_inputs["soc_end"], abs=1e-6)
+
+def highs_solve(inputs, initial, deadline):
+    return ess_scheduling.solve_model(inputs, logger, "matrix", solver="highs", mip_gap=0)
+
+@pytest.mark.parametrize("horizon_h, capacity_kWh, window, overlap", [
+    (72, 10, 96, 0), (72, 10, 96, 32), (72, 10, 48, 16), (72, 20, 96, 0), (24, 100, 40, 0), (24, 100, 30, 0)])
+def test_stitched_plan_close_to_full_solve(horizon_h, capacity_kWh, window, overlap):
+    model_inputs = scenarios.synthetic_model_inputs(horizon_h, 15)
+    model_inputs["ess_eff_kWh"] = capacity_kWh * 1000
+    full = highs_solve(model_inputs, None, None)
+    idle = ess_scheduling.solution_cost(model_inputs, ess_scheduling.plan_solution(np.zeros(len(model_inputs["load"])), model_inputs))
+
+    solution = ess_scheduling.solve_receding_horizon(model_inputs, window, overlap, highs_solve, logger=logger)
+    assert solution is not None
+    assert solution["objective"] <= idle + 1e-9
+    assert solution["objective"] == pytest.approx(full["objective"], rel=1e-3)
+
+def test_short_tail_joins_previous_window():
+    assert ess_scheduling.horizon_windows(96, 40, 0) == [(0, 40, 40), (40, 96, 56)]
+    assert ess_scheduling.horizon_windows(288, 96, 32) == [(0, 96, 64), (64, 160, 64), (128, 224, 64), (192, 288, 96)]
+    assert ess_scheduling.horizon_windows(30, 40, 8) == [(0, 30, 30)]
+
+def test_generate_schedule_without_overlap():
+    arguments = benchmark.synthetic_arguments(72, 15)
+    schedule = ess_scheduling.generate_schedule(**arguments, logger=logger, model_backend="dp",
+                                                horizon_window=12 * 3600, horizon_overlap=0)
+    assert schedule is not None and len(schedule) > 48
@@ -0,0 +1,172 @@
+### Lightweight tracing spans and per-run metrics ###
+# span() is a no-op unless tracing is enabled, so instrumentation can stay in
+# hot paths. Finished spans are kept until reset() and summarised per name.
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+_enabled = False
+_local = threading.local()
+_lock = threading.Lock()
+_finished = []
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    with _lock:
+        _finished.clear()
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "duration", "parent", "depth")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self.duration = None
+        self.parent = None
+        self.depth = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            self.parent = stack[-1].name
+            self.depth = len(stack)
+        stack.append(self)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.monotonic() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _stack().pop()
+        with _lock:
+            _finished.append(self)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name, **attrs):
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+def record(name, duration, **attrs):
+    "Add an already measured span as a child of the current span"
+    if not _enabled:
+        return
+    s = Span(name, attrs)
+    stack = _stack()
+    if stack:
+        s.parent = stack[-1].name
+        s.depth = len(stack)
+    s.start = time.monotonic() - duration
+    s.duration = duration
+    with _lock:
+        _finished.append(s)
+
+def spans():
+    with _lock:
+        return list(_finished)
+
+def summary():
+    "Per span name: count, total and max seconds; HTTP requests also per method/endpoint/status, solves per solver"
+    by_name = defaultdict(lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0})
+    http = defaultdict(lambda: {"count": 0, "total_s": 0.0, "bytes": 0})
+    solvers = defaultdict(lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0})
+    for s in spans():
+        agg = by_name[s.name]
+        agg["count"] += 1
+        agg["total_s"] += s.duration
+        agg["max_s"] = max(agg["max_s"], s.duration)
+        if s.name == "http.request":
+            key = (s.attrs.get("method"), s.attrs.get("endpoint"), s.attrs.get("status"))
+            h = http[key]
+            h["count"] += 1
+            h["total_s"] += s.duration
+            h["bytes"] += s.attrs.get("bytes", 0) or 0
+        if "solver" in s.attrs:
+            sv = solvers[s.attrs["solver"]]
+            sv["count"] += 1
+            sv["total_s"] += s.duration
+            sv["max_s"] = max(sv["max_s"], s.duration)
+    return {
+        "spans": {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in agg.items()}
+                  for name, agg in by_name.items()},
+        "http": [{"method": m, "endpoint": e, "status": st, **{k: round(v, 6) if isinstance(v, float) else v for k, v in h.items()}}
+                 for (m, e, st), h in http.items()],
+        "solvers": {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in agg.items()}
+                    for name, agg in solvers.items()},
+    }
+
+def log_summary(logger, run_name="cycle"):
+    if not _enabled:
+        return
+    logger.info("trace summary %s %s", run_name, json.dumps(summary(), sort_keys=True))
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_openmetrics(path, labels=None, prefix="dsxos_app"):
+    "Write the run summary in OpenMetrics text format (Prometheus textfile collector compatible)"
+    if not _enabled:
+        return
+    labels = labels or {}
+    base = ",".join(f'{k}="{_label(v)}"' for k, v in sorted(labels.items()))
+
+    def series(extra):
+        parts = [p for p in (base, ",".join(f'{k}="{_label(v)}"' for k, v in extra.items())) if p]
+        return "{" + ",".join(parts) + "}"
+
+    data = summary()
+    lines = [
+        f"# TYPE {prefix}_span_seconds gauge",
+        f"# HELP {prefix}_span_seconds Total time spent in span during the last run.",
+    ]
+    lines += [f"{prefix}_span_seconds{series({'span': n})} {a['total_s']}" for n, a in sorted(data["spans"].items())]
+    lines += [f"# TYPE {prefix}_span_count gauge", f"# HELP {prefix}_span_count Number of spans during the last run."]
+    lines += [f"{prefix}_span_count{series({'span': n})} {a['count']}" for n, a in sorted(data["spans"].items())]
+    lines += [f"# TYPE {prefix}_http_requests gauge", f"# HELP {prefix}_http_requests HTTP requests during the last run."]
+    lines += [f"{prefix}_http_requests{series({'method': h['method'], 'endpoint': h['endpoint'], 'status': h['status']})} {h['count']}"
+              for h in data["http"]]
+    lines += [f"# TYPE {prefix}_http_response_bytes gauge", f"# HELP {prefix}_http_response_bytes HTTP response bytes during the last run."]
+    lines += [f"{prefix}_http_response_bytes{series({'method': h['method'], 'endpoint': h['endpoint'], 'status': h['status']})} {h['bytes']}"
+              for h in data["http"]]
+    lines += [f"# TYPE {prefix}_solver_seconds gauge", f"# HELP {prefix}_solver_seconds Time spent in the MILP/LP solver during the last run."]
+    lines += [f"{prefix}_solver_seconds{series({'solver': n})} {a['total_s']}" for n, a in sorted(data["solvers"].items())]
+    lines.append("# EOF")
+
+    # Write atomically so a scraper never sees a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)